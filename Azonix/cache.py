@@ -0,0 +1,133 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class TwoTierCache(BaseCache):
+    # An in-process LRU in front of the shared cache alias named by LOCATION,
+    # for keys starting with LOCAL_KEY_PREFIX; every other key goes straight to
+    # the shared cache. Writes go to both tiers and local entries expire after
+    # LOCAL_TIMEOUT seconds, which is how long another worker can keep serving
+    # a value after it changes. Values are pickled locally, like LocMemCache,
+    # so callers can't mutate the cached copy.
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.remote_alias = location or 'default'
+        self.local_key_prefix = options.get('LOCAL_KEY_PREFIX', '')
+        self.local_timeout = int(options.get('LOCAL_TIMEOUT', 10))
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def remote(self):
+        return caches[self.remote_alias]
+
+    def is_local(self, key):
+        return key.startswith(self.local_key_prefix)
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return entry
+
+    def _set_local(self, key, value, timeout):
+        expires = self.local_timeout if timeout is None else min(timeout, self.local_timeout)
+        if expires <= 0:
+            self._delete_local(key)
+            return
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._local[key] = (time.monotonic() + expires, pickled)
+            self._local.move_to_end(key)
+            while len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+
+    def _delete_local(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def get(self, key, default=None, version=None):
+        if not self.is_local(key):
+            return self.remote.get(key, default, version=version)
+        local_key = self.make_and_validate_key(key, version=version)
+        entry = self._get_local(local_key)
+        if entry is not None:
+            return pickle.loads(entry[1])
+        missing = object()
+        value = self.remote.get(key, missing, version=version)
+        if value is missing:
+            return default
+        self._set_local(local_key, value, self.local_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self.remote.get_many([key for key in keys if not self.is_local(key)], version=version)
+        missing = object()
+        for key in keys:
+            if self.is_local(key):
+                value = self.get(key, missing, version=version)
+                if value is not missing:
+                    values[key] = value
+        return values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        self.remote.set(key, value, timeout=timeout, version=version)
+        if self.is_local(key):
+            self._set_local(self.make_and_validate_key(key, version=version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        failed = self.remote.set_many(data, timeout=timeout, version=version)
+        for key, value in data.items():
+            if self.is_local(key) and key not in failed:
+                self._set_local(self.make_and_validate_key(key, version=version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        added = self.remote.add(key, value, timeout=timeout, version=version)
+        if added and self.is_local(key):
+            self._set_local(self.make_and_validate_key(key, version=version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.remote.touch(key, timeout=self._timeout(timeout), version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._delete_local(self.make_and_validate_key(key, version=version))
+        return self.remote.incr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        self._delete_local(self.make_and_validate_key(key, version=version))
+        return self.remote.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self._delete_local(self.make_and_validate_key(key, version=version))
+        self.remote.delete_many(keys, version=version)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def clear(self):
+        self.clear_local()
+        self.remote.clear()
@@ -0,0 +1,137 @@
+import base64
+import binascii
+import json
+from types import SimpleNamespace
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPage(list):
+    paginator = SimpleNamespace(count=None, num_pages=None)
+
+
+class KeysetPaginationMixin:
+    # Opt-in keyset mode for page number paginators: ?pagination=cursor starts it
+    # and the next/previous links carry an opaque ?cursor= token. The response
+    # envelope is unchanged, but count and total_pages are None since no COUNT(*)
+    # is run. Pages follow the queryset's own ordering with the primary key as the
+    # tie-breaker; keyset_ordering is used when the queryset isn't ordered.
+    keyset_ordering = ('id',)
+    cursor_query_param = 'cursor'
+    pagination_mode_query_param = 'pagination'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = (request.query_params.get(self.pagination_mode_query_param) == 'cursor'
+                       or self.cursor_query_param in request.query_params)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        self.request = request
+        self.ordering = self.get_keyset_ordering(queryset)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor['reverse']
+
+        ordering = [self.flip(field) for field in self.ordering] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, cursor['values']))
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = KeysetPage(results)
+        return list(self.page)
+
+    def get_keyset_ordering(self, queryset):
+        requested = list(queryset.query.order_by) or list(self.keyset_ordering)
+        pk_name = queryset.model._meta.pk.name
+        ordering = []
+        for field in requested:
+            name = field.lstrip('-') if isinstance(field, str) else None
+            if name == 'pk':
+                name, field = pk_name, field.replace('pk', pk_name)
+            if name is None or not self.keyset_supports(queryset, name):
+                raise ValidationError(f"Cursor pagination does not support this ordering: {field}.")
+            ordering.append(field)
+            if name == pk_name:
+                return tuple(ordering)
+        ordering.append(f'-{pk_name}' if ordering[-1].startswith('-') else pk_name)
+        return tuple(ordering)
+
+    def keyset_supports(self, queryset, name):
+        # Plain columns and annotations only; NULLs can't be compared, so nullable
+        # columns are only trusted when the paginator itself names them.
+        if name in queryset.query.annotations:
+            return True
+        try:
+            field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        if not field.concrete or field.many_to_many:
+            return False
+        return not field.null or name in {key.lstrip('-') for key in self.keyset_ordering}
+
+    def get_next_link(self):
+        if not getattr(self, 'keyset', False):
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not getattr(self, 'keyset', False):
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def keyset_filter(self, ordering, values):
+        # (a, b) > (x, y) written as a >= x AND (a > x OR (a = x AND b > y)) so the
+        # leading column can drive an index range scan.
+        fields = [field.lstrip('-') for field in ordering]
+        lookups = ['lt' if field.startswith('-') else 'gt' for field in ordering]
+        condition = Q()
+        for i, field in enumerate(fields):
+            equal = {fields[j]: values[j] for j in range(i)}
+            condition |= Q(**equal, **{f'{field}__{lookups[i]}': values[i]})
+        return Q(**{f'{fields[0]}__{lookups[0]}e': values[0]}) & condition
+
+    def encode_cursor(self, item, reverse):
+        values = [getattr(item, field.lstrip('-')) for field in self.ordering]
+        payload = json.dumps({'ordering': list(self.ordering), 'values': values, 'reverse': reverse}, cls=DjangoJSONEncoder)
+        token = base64.urlsafe_b64encode(payload.encode()).decode()
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            values, reverse = cursor['values'], bool(cursor['reverse'])
+            ordering = cursor['ordering']
+        except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        # A cursor only makes sense for the ordering it was issued for.
+        if ordering != list(self.ordering) or not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return {'values': values, 'reverse': reverse}
+
+    @staticmethod
+    def flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
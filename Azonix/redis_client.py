@@ -0,0 +1,11 @@
+import redis
+from django.conf import settings
+
+_clients = {}
+
+
+def get_redis():
+    url = settings.REDIS_URL
+    if url not in _clients:
+        _clients[url] = redis.Redis.from_url(url, decode_responses=True)
+    return _clients[url]
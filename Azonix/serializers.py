@@ -0,0 +1,16 @@
+class SparseFieldsetMixin:
+    # ?fields=id,slugname on a GET limits the representation to the listed
+    # fields; dropped method fields are never computed. Unknown names are ignored.
+    fields_query_param = 'fields'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        requested = request.query_params.get(self.fields_query_param)
+        if not requested:
+            return
+        allowed = {name.strip() for name in requested.split(',')}
+        for name in set(self.fields) - allowed:
+            self.fields.pop(name)
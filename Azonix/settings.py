@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'channels',
     'corsheaders',
     'parler',
@@ -198,6 +199,32 @@ CHANNEL_LAYERS = {
         },
     },
 }
+REDIS_URL = 'redis://127.0.0.1:6379/2'
+# Where active carts are kept: 'order_app.carts.DatabaseCartBackend' or
+# 'order_app.carts.RedisCartBackend' (written back to the database when idle).
+CART_BACKEND = 'order_app.carts.DatabaseCartBackend'
+
+# django-parler only uses the default cache; its keys start with PARLER_CACHE_PREFIX
+# and are also kept in a per-process LRU, so a translation edited on one worker can
+# be served stale by the others for up to LOCAL_TIMEOUT seconds.
+PARLER_CACHE_PREFIX = 'translations'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'Azonix.cache.TwoTierCache',
+        'LOCATION': 'shared',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'LOCAL_KEY_PREFIX': f'{PARLER_CACHE_PREFIX}.',
+            'LOCAL_TIMEOUT': 10,
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+}
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Azonix API',
@@ -244,7 +271,15 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379'
 CELERY_BEAT_SCHEDULE = {
     'update_delivery_status': {
         'task': 'order_app.tasks.update_delivery_status',
-        'schedule': 86400, 
+        'schedule': 300, 
+    },
+    'compact_sales_buckets': {
+        'task': 'product_app.tasks.compact_sales_buckets',
+        'schedule': 3600,
+    },
+    'flush_idle_carts': {
+        'task': 'order_app.tasks.flush_idle_carts',
+        'schedule': 300,
     },
 }
 # Allow all origins (not recommended for production)
@@ -0,0 +1,56 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+class Echo:
+    # csv.writer only needs a write() method; returning the line lets us yield it.
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row.get(field) for field in fields])
+
+
+def jsonl_lines(fields, rows):
+    for row in rows:
+        yield json.dumps({field: row.get(field) for field in fields}, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def serialize_lines(file_format, fields, rows):
+    if file_format == 'jsonl':
+        return jsonl_lines(fields, rows)
+    return csv_lines(fields, rows)
+
+
+def read_rows(stream, file_format):
+    # Yields (line number, dict) from a text stream without loading it all in memory.
+    if file_format == 'jsonl':
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, ValueError(f"Invalid JSON: {str(e)}")
+                continue
+            yield number, row if isinstance(row, dict) else ValueError('Each line must be a JSON object.')
+    else:
+        for number, row in enumerate(csv.DictReader(stream), start=2):
+            yield number, row
+
+
+def streaming_response(file_format, fields, rows, filename):
+    response = StreamingHttpResponse(serialize_lines(file_format, fields, rows), content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
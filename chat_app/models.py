@@ -10,5 +10,10 @@ class Message(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='message_timestamp_id_idx'),
+        ]
+
     def __str__(self):
         return f'{self.sender} to {self.receiver}: {self.content}'
\ No newline at end of file
@@ -4,11 +4,13 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
+from Azonix.pagination import KeysetPaginationMixin
 
 logger = logging.getLogger(__name__)
 
-class ChatMessagePagination(PageNumberPagination):
+class ChatMessagePagination(KeysetPaginationMixin, PageNumberPagination):
     page_size = 10
+    keyset_ordering = ('-timestamp', '-id')
 
 class ChatMessageViewSet(viewsets.ModelViewSet):
     from .models import Message 
@@ -0,0 +1,299 @@
+import logging
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+from redis.exceptions import WatchError
+from Azonix.redis_client import get_redis
+from product_app.models import Product
+from .models import Cart, CartItem
+
+logger = logging.getLogger(__name__)
+
+_backends = {}
+
+
+def get_cart_backend():
+    path = getattr(settings, 'CART_BACKEND', 'order_app.carts.DatabaseCartBackend')
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def cart_items_queryset():
+    return CartItem.objects.select_related('product__category', 'product__subcategory').prefetch_related(
+        'product__translations', 'product__category__translations', 'product__subcategory__translations',
+    )
+
+
+def apply_operations(quantities, operations):
+    # Returns the cart's quantities after the operations, plus {index: error}
+    # for operations that can't be applied; nothing is written either way.
+    quantities = dict(quantities)
+    errors = {}
+    for index, operation in enumerate(operations):
+        product_id = operation['product_id']
+        if operation['op'] == 'add':
+            quantities[product_id] = quantities.get(product_id, 0) + operation['quantity']
+        elif product_id not in quantities:
+            errors[index] = 'Product is not in the cart.'
+        elif operation['op'] == 'update':
+            quantities[product_id] = operation['quantity']
+        else:
+            del quantities[product_id]
+    return quantities, errors
+
+
+def write_items(cart_id, existing, quantities):
+    # existing maps product id -> locked CartItem; rows are deleted, updated
+    # and inserted with one statement each. New rows are upserted, since a
+    # concurrent add() can insert the same product after the rows were locked.
+    CartItem.objects.filter(cart_id=cart_id).exclude(product_id__in=quantities).delete()
+    changed = [item for product_id, item in existing.items()
+               if product_id in quantities and item.quantity != quantities[product_id]]
+    for item in changed:
+        item.quantity = quantities[item.product_id]
+    CartItem.objects.bulk_update(changed, ['quantity'])
+    CartItem.objects.bulk_create([CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+                                  for product_id, quantity in quantities.items() if product_id not in existing],
+                                 update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'])
+
+
+class DatabaseCartBackend:
+    def get_cart(self, user_id):
+        return Cart.objects.prefetch_related(Prefetch('cartitem_set', queryset=cart_items_queryset(), to_attr='items')).filter(
+            user_id=user_id,
+        ).first()
+
+    def has_item(self, user_id, product_id):
+        return CartItem.objects.filter(cart__user_id=user_id, product_id=product_id).exists()
+
+    def add(self, user_id, product_id, quantity):
+        cart, created = Cart.objects.get_or_create(user_id=user_id)
+        # One statement, so concurrent adds of the same product can't lose increments.
+        table = CartItem._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (cart_id, product_id, quantity) VALUES (%s, %s, %s) '
+                f'ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity',
+                [cart.id, product_id, quantity],
+            )
+
+    def update(self, user_id, product_id, quantity):
+        return CartItem.objects.filter(cart__user_id=user_id, product_id=product_id).update(quantity=quantity) > 0
+
+    def remove(self, user_id, product_id):
+        deleted, _ = CartItem.objects.filter(cart__user_id=user_id, product_id=product_id).delete()
+        return deleted > 0
+
+    def apply_batch(self, user_id, operations):
+        with transaction.atomic():
+            cart, created = Cart.objects.get_or_create(user_id=user_id)
+            existing = {item.product_id: item for item in CartItem.objects.select_for_update().filter(cart=cart)}
+            quantities, errors = apply_operations(
+                {product_id: item.quantity for product_id, item in existing.items()}, operations,
+            )
+            if not errors:
+                write_items(cart.id, existing, quantities)
+        return errors
+
+    def clear(self, user_id):
+        CartItem.objects.filter(cart__user_id=user_id).delete()
+
+
+class RedisCartBackend:
+    # Active carts live in one hash per user (product id -> quantity, plus the
+    # cart's id and creation time). Every write adds the user to a dirty set
+    # scored by the write time; flush_idle() copies carts that have been quiet
+    # for a while back to Cart/CartItem, and checkout clears both. Anything
+    # copying between the hash and the tables holds the Cart row lock.
+    key_prefix = 'cart'
+    item_prefix = 'p:'
+    ttl = 60 * 60 * 24 * 7
+
+    # Loads the database copy unless another request got there first. A hash
+    # without an id is a leftover of a cleared cart and is replaced.
+    load_script = """
+    if redis.call('HEXISTS', KEYS[1], 'id') == 0 then
+        redis.call('DEL', KEYS[1])
+        redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+        redis.call('EXPIRE', KEYS[1], ARGV[1])
+    end
+    return 1
+    """
+    # Changes one item and marks the cart dirty, or returns -1 without writing
+    # if the cart isn't loaded, so a write racing clear() can't leave a hash
+    # without an id behind. 'set' only touches items already in the cart.
+    item_script = """
+    if redis.call('HEXISTS', KEYS[1], 'id') == 0 then
+        return -1
+    end
+    local result
+    if ARGV[1] == 'incr' then
+        result = redis.call('HINCRBY', KEYS[1], ARGV[2], ARGV[3])
+    elseif ARGV[1] == 'set' then
+        if redis.call('HEXISTS', KEYS[1], ARGV[2]) == 0 then
+            return 0
+        end
+        redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+        result = 1
+    else
+        result = redis.call('HDEL', KEYS[1], ARGV[2])
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    redis.call('ZADD', KEYS[2], ARGV[6], ARGV[5])
+    return result
+    """
+    # Only forgets a dirty cart if it wasn't written to while being flushed.
+    clean_script = """
+    if redis.call('ZSCORE', KEYS[1], ARGV[1]) == ARGV[2] then
+        return redis.call('ZREM', KEYS[1], ARGV[1])
+    end
+    return 0
+    """
+
+    @property
+    def redis(self):
+        return get_redis()
+
+    @property
+    def dirty_key(self):
+        return f'{self.key_prefix}:dirty'
+
+    def cart_key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def load(self, user_id, create=False):
+        key = self.cart_key(user_id)
+        if self.redis.hexists(key, 'id'):
+            return True
+        with transaction.atomic():
+            cart = Cart.objects.select_for_update().filter(user_id=user_id).first()
+            if cart is None:
+                if not create:
+                    return False
+                cart, created = Cart.objects.get_or_create(user_id=user_id)
+            mapping = {'id': cart.id, 'created_at': cart.created_at.isoformat()}
+            for product_id, quantity in cart.cartitem_set.values_list('product_id', 'quantity'):
+                mapping[f'{self.item_prefix}{product_id}'] = quantity
+            self.redis.eval(self.load_script, 1, key, self.ttl, *[value for pair in mapping.items() for value in pair])
+        return True
+
+    def items(self, data):
+        return {int(field[len(self.item_prefix):]): int(quantity)
+                for field, quantity in data.items() if field.startswith(self.item_prefix)}
+
+    def touch(self, pipe, user_id):
+        pipe.expire(self.cart_key(user_id), self.ttl)
+        pipe.zadd(self.dirty_key, {str(user_id): int(time.time() * 1000)})
+
+    def write_item(self, user_id, op, product_id, value=0, create=False):
+        while True:
+            result = self.redis.eval(
+                self.item_script, 2, self.cart_key(user_id), self.dirty_key,
+                op, f'{self.item_prefix}{product_id}', value, self.ttl, str(user_id), int(time.time() * 1000),
+            )
+            if result != -1:
+                return result
+            if not self.load(user_id, create=create):
+                return 0
+
+    def get_cart(self, user_id):
+        data = {}
+        # Checkout may clear the cart between loading and reading it.
+        while 'id' not in data:
+            if not self.load(user_id):
+                return None
+            data = self.redis.hgetall(self.cart_key(user_id))
+        cart = Cart(id=int(data['id']), user_id=int(user_id), created_at=parse_datetime(data['created_at']))
+        quantities = self.items(data)
+        products = Product.objects.select_related('category', 'subcategory').prefetch_related(
+            'translations', 'category__translations', 'subcategory__translations',
+        ).in_bulk(quantities)
+        cart.items = [CartItem(cart=cart, product=products[product_id], quantity=quantity)
+                      for product_id, quantity in quantities.items() if product_id in products]
+        return cart
+
+    def has_item(self, user_id, product_id):
+        return self.load(user_id) and self.redis.hexists(self.cart_key(user_id), f'{self.item_prefix}{product_id}')
+
+    def add(self, user_id, product_id, quantity):
+        self.write_item(user_id, 'incr', product_id, quantity, create=True)
+
+    def update(self, user_id, product_id, quantity):
+        return self.write_item(user_id, 'set', product_id, quantity) > 0
+
+    def remove(self, user_id, product_id):
+        return self.write_item(user_id, 'del', product_id) > 0
+
+    def apply_batch(self, user_id, operations):
+        key = self.cart_key(user_id)
+        self.load(user_id, create=True)
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    data = pipe.hgetall(key)
+                    if 'id' not in data:
+                        pipe.unwatch()
+                        self.load(user_id, create=True)
+                        continue
+                    current = self.items(data)
+                    quantities, errors = apply_operations(current, operations)
+                    if errors:
+                        pipe.unwatch()
+                        return errors
+                    pipe.multi()
+                    removed = [f'{self.item_prefix}{product_id}' for product_id in current if product_id not in quantities]
+                    if removed:
+                        pipe.hdel(key, *removed)
+                    changed = {f'{self.item_prefix}{product_id}': quantity for product_id, quantity in quantities.items()
+                               if current.get(product_id) != quantity}
+                    if changed:
+                        pipe.hset(key, mapping=changed)
+                    self.touch(pipe, user_id)
+                    pipe.execute()
+                    return errors
+                except WatchError:
+                    continue
+
+    def clear(self, user_id):
+        # Checkout holds the cart lock until it commits, so a flush waiting on it
+        # finds the hash already gone instead of writing the purchased items back.
+        with transaction.atomic():
+            Cart.objects.select_for_update().filter(user_id=user_id).first()
+            with self.redis.pipeline() as pipe:
+                pipe.delete(self.cart_key(user_id))
+                pipe.zrem(self.dirty_key, str(user_id))
+                pipe.execute()
+            CartItem.objects.filter(cart__user_id=user_id).delete()
+
+    def flush(self, user_id):
+        score = self.redis.zscore(self.dirty_key, str(user_id))
+        with transaction.atomic():
+            cart = Cart.objects.select_for_update().filter(user_id=user_id).first()
+            data = self.redis.hgetall(self.cart_key(user_id)) if cart else {}
+            if 'id' in data and int(data['id']) == cart.id:
+                quantities = self.items(data)
+                existing = {item.product_id: item for item in CartItem.objects.select_for_update().filter(cart_id=cart.id)}
+                # Products deleted since they were added to the cart are dropped.
+                new = set(quantities) - set(existing)
+                for product_id in new - set(Product.objects.filter(id__in=new).values_list('id', flat=True)):
+                    del quantities[product_id]
+                write_items(cart.id, existing, quantities)
+        if score is not None:
+            self.redis.eval(self.clean_script, 1, self.dirty_key, str(user_id), str(int(score)))
+
+    def flush_idle(self, idle_seconds=600, limit=500):
+        cutoff = int((time.time() - idle_seconds) * 1000)
+        user_ids = self.redis.zrangebyscore(self.dirty_key, '-inf', cutoff, start=0, num=limit)
+        flushed = 0
+        for user_id in user_ids:
+            try:
+                self.flush(int(user_id))
+                flushed += 1
+            except Exception as e:
+                logger.error(f"Error flushing cart of user {user_id}: {str(e)}")
+        return flushed
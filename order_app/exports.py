@@ -0,0 +1,44 @@
+from django.db.models import Prefetch
+from .models import OrderItem
+
+EXPORT_FIELDS = [
+    'order_id', 'order_date', 'delivery_status', 'delivery_date', 'shipped_at',
+    'user_id', 'username', 'email', 'delivery_address', 'total_price', 'total_price_in_rials',
+    'product_id', 'product_slugname', 'product_price', 'quantity',
+]
+
+
+def export_rows(queryset, chunk_size=2000):
+    # One row per order item. iterator() reads the orders through a server-side
+    # cursor and runs the item prefetch once per chunk, so memory stays flat.
+    items = OrderItem.objects.select_related('product').only(
+        'order_id', 'quantity', 'product__slugname', 'product__price',
+    ).order_by('id')
+    queryset = queryset.prefetch_related(None).select_related('user').prefetch_related(
+        Prefetch('order_items', queryset=items),
+    )
+    for order in queryset.iterator(chunk_size=chunk_size):
+        row = {
+            'order_id': order.id,
+            'order_date': order.order_date,
+            'delivery_status': order.delivery_status,
+            'delivery_date': order.delivery_date,
+            'shipped_at': order.shipped_at,
+            'user_id': order.user_id,
+            'username': order.user.username,
+            'email': order.user.email,
+            'delivery_address': order.delivery_address,
+            'total_price': order.total_price,
+            'total_price_in_rials': order.total_price_in_rials,
+        }
+        order_items = order.order_items.all()
+        if not order_items:
+            yield row
+        for item in order_items:
+            yield {
+                **row,
+                'product_id': item.product_id,
+                'product_slugname': item.product.slugname,
+                'product_price': item.product.price,
+                'quantity': item.quantity,
+            }
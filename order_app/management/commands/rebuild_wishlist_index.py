@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from order_app.wishlists import rebuild_wishlist_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Redis wishlist membership index from wishlist items.'
+
+    def handle(self, *args, **options):
+        rebuild_wishlist_index()
+        self.stdout.write(self.style.SUCCESS('Wishlist index rebuilt.'))
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order_app', '0008_order_order_date_id_idx'),
+        ('product_app', '0009_product_product_price_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['delivery_status', 'shipped_at'], name='order_status_shipped_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order_app', '0009_order_order_status_shipped_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wishlistitem',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:57
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    CartItem = apps.get_model('order_app', 'CartItem')
+    duplicates = CartItem.objects.values('cart_id', 'product_id').annotate(
+        rows=Count('id'), keep=Min('id'), total=Sum('quantity'),
+    ).filter(rows__gt=1)
+    for row in duplicates.iterator():
+        CartItem.objects.filter(id=row['keep']).update(quantity=row['total'])
+        CartItem.objects.filter(cart_id=row['cart_id'], product_id=row['product_id']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order_app', '0010_wishlistitem_notified_at'),
+        ('product_app', '0013_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:32
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    Cart = apps.get_model('order_app', 'Cart')
+    CartItem = apps.get_model('order_app', 'CartItem')
+    duplicates = Cart.objects.values('user_id').annotate(carts=Count('id'), keep=Min('id')).filter(carts__gt=1)
+    for row in duplicates.iterator():
+        extra = Cart.objects.filter(user_id=row['user_id']).exclude(id=row['keep'])
+        for item in CartItem.objects.filter(cart__in=extra):
+            kept, created = CartItem.objects.get_or_create(
+                cart_id=row['keep'], product_id=item.product_id, defaults={'quantity': item.quantity},
+            )
+            if not created:
+                kept.quantity += item.quantity
+                kept.save(update_fields=['quantity'])
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order_app', '0011_cartitem_unique_cart_product'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user',), name='unique_cart_user'),
+        ),
+    ]
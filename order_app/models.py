@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from user_app.models import User
+from product_app.leaderboard import record_order_sales
 from product_app.models import Product
 
 class Order(models.Model):
@@ -22,14 +26,49 @@ class Order(models.Model):
     products = models.ManyToManyField(Product)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_date', 'id'], name='order_date_id_idx'),
+            models.Index(fields=['delivery_status', 'shipped_at'], name='order_status_shipped_idx'),
+        ]
+
     def cancel_order(self):
-        for item in self.order_items.all():
-            product = item.product
-            product.stock += item.quantity 
-            product.save()
+        # Restock with F() updates under the same row locks reserve_stock takes,
+        # so a concurrent checkout's decrement is never overwritten.
+        from product_app.caching import invalidate_response_cache_on_commit, product_cache_tags
+        from product_app.tasks import notify_back_in_stock
 
-        self.delivery_status = 'cancelled'
-        self.save()
+        with transaction.atomic():
+            locked = Order.objects.select_for_update().get(pk=self.pk)
+            if locked.delivery_status == 'cancelled':
+                self.delivery_status = locked.delivery_status
+                return False
+            quantities = {}
+            for product_id, quantity in self.order_items.values_list('product_id', 'quantity'):
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            products = Product.objects.select_for_update().filter(id__in=quantities).order_by('id').in_bulk()
+            now = timezone.now()
+            for product_id, quantity in quantities.items():
+                Product.objects.filter(pk=product_id).update(
+                    stock=F('stock') + quantity,
+                    sales_count=Greatest(F('sales_count') - quantity, 0),
+                    updated_at=now,
+                )
+            record_order_sales([(product_id, products[product_id].category_id, products[product_id].subcategory_id, quantity)
+                                for product_id, quantity in quantities.items() if product_id in products],
+                               when=self.order_date, sign=-1)
+            invalidate_response_cache_on_commit(*(tag for product in products.values() for tag in product_cache_tags(
+                product.id, product.category_id, product.subcategory_id,
+            )))
+            for product in products.values():
+                if product.stock == 0 and quantities[product.id] > 0:
+                    product_id, restocked_at = product.id, now.isoformat()
+                    transaction.on_commit(lambda product_id=product_id, restocked_at=restocked_at:
+                                          notify_back_in_stock.delay(product_id, restocked_at))
+
+            self.delivery_status = 'cancelled'
+            self.save(update_fields=['delivery_status'])
+        return True
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='order_items', on_delete=models.CASCADE)
@@ -40,11 +79,21 @@ class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user'], name='unique_cart_user'),
+        ]
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
 
 class Wishlist(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wishlist')
@@ -56,6 +105,7 @@ class WishlistItem(models.Model):
     wishlist = models.ForeignKey(Wishlist, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     added_at = models.DateTimeField(auto_now_add=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ('wishlist', 'product') 
@@ -4,12 +4,30 @@ from product_app.serializers import ProductSerializer,ProductDetailSerializer
 from product_app.models import Product
 from django.db import transaction
 
+class OrderItemListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            product_ids = {item.get('product') for item in data if isinstance(item, dict)}
+            self.products = Product.objects.in_bulk([pk for pk in product_ids if str(pk).isdigit()])
+        return super().to_internal_value(data)
+
+class OrderItemProductField(serializers.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        products = getattr(self.parent.parent, 'products', None) if self.parent else None
+        if products is not None:
+            try:
+                return products[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all()) 
+    product = OrderItemProductField(queryset=Product.objects.all()) 
     product_detail=ProductDetailSerializer(source='product', read_only=True)
     class Meta:
         model = OrderItem
         fields = ['product', 'quantity','product_detail']
+        list_serializer_class = OrderItemListSerializer
     def create(self, validated_data):
         product = validated_data.pop('product')
         quantity = validated_data.pop('quantity')
@@ -30,22 +48,28 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ["id",'user', 'user_first_name', 'user_last_name', 'user_phone_number','shipped_at', 'delivery_address', 'delivery_status', 'total_price','total_price_in_rials', 'order_date', 'delivery_date', 'order_items']
         read_only_fields = ['id', 'user', 'order_date', 'total_price','total_price_in_rials']  
+
+    def group_items(self, order_items_data):
+        lines = {}
+        for item_data in order_items_data:
+            product = item_data['product']
+            _, quantity = lines.get(product.id, (product, 0))
+            lines[product.id] = (product, quantity + item_data['quantity'])
+        return lines
+
+    def compute_totals(self, lines):
+        total_price = sum(product.price_after_discount * quantity for product, quantity in lines.values())
+        total_price_in_rials = sum(product.price_after_discount_in_rials * quantity for product, quantity in lines.values())
+        return total_price, total_price_in_rials
+
     def create(self, validated_data):
-        order_items_data = validated_data.pop('order_items')
+        lines = self.group_items(validated_data.pop('order_items'))
+        total_price, total_price_in_rials = self.compute_totals(lines)
         with transaction.atomic():
-            order = Order.objects.create(**validated_data)
-            total_price_in_rials=0
-            total_price = 0
-            for item_data in order_items_data:
-                product = item_data['product']
-                quantity = item_data['quantity']
-                OrderItem.objects.create(order=order, product=product, quantity=quantity)
-                total_price += product.price_after_discount * quantity
-                total_price_in_rials += product.price_after_discount_in_rials * quantity
-
-            order.total_price = total_price
-            order.total_price_in_rials=total_price_in_rials
-            order.save()
+            order = Order.objects.create(total_price=total_price, total_price_in_rials=total_price_in_rials, **validated_data)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=quantity) for product, quantity in lines.values()
+            ])
 
         return order
 
@@ -56,21 +80,36 @@ class OrderSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         
-        if order_items_data is not None:
-            instance.order_items.all().delete()
-            total_price = 0
-            total_price_in_rials=0
-            for item_data in order_items_data:
-                product = item_data['product']
-                quantity = item_data['quantity']
-                OrderItem.objects.create(order=instance, product=product, quantity=quantity)
-                total_price += product.price_after_discount * quantity
-                total_price_in_rials += product.price_after_discount_in_rials * quantity
-
-            instance.total_price = total_price
-            instance.total_price_in_rials = total_price_in_rials
-
-        instance.save()
+        with transaction.atomic():
+            if order_items_data is not None:
+                lines = self.group_items(order_items_data)
+                existing = {}
+                removed = []
+                for item in instance.order_items.all():
+                    if item.product_id in lines and item.product_id not in existing:
+                        existing[item.product_id] = item
+                    else:
+                        removed.append(item.id)
+
+                changed = []
+                for product_id, item in existing.items():
+                    quantity = lines[product_id][1]
+                    if item.quantity != quantity:
+                        item.quantity = quantity
+                        changed.append(item)
+
+                if removed:
+                    OrderItem.objects.filter(id__in=removed).delete()
+                if changed:
+                    OrderItem.objects.bulk_update(changed, ['quantity'])
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=instance, product=product, quantity=quantity)
+                    for product_id, (product, quantity) in lines.items() if product_id not in existing
+                ])
+
+                instance.total_price, instance.total_price_in_rials = self.compute_totals(lines)
+
+            instance.save()
         return instance
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -81,31 +120,58 @@ class CartItemSerializer(serializers.ModelSerializer):
         exclude = ['cart']
 
 class CartSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(source='cartitem_set', many=True)
+    items = CartItemSerializer(many=True)
     total_price = serializers.SerializerMethodField()
     total_price_in_rials = serializers.SerializerMethodField()
+
+    def get_totals(self, obj):
+        # Both totals come from one pass over the items the cart backend loaded.
+        totals = getattr(obj, '_totals', None)
+        if totals is None:
+            total, total_in_rials = 0, 0
+            for item in obj.items:
+                total += item.quantity * item.product.price_after_discount
+                total_in_rials += item.quantity * item.product.price_after_discount_in_rials
+            totals = obj._totals = (total, total_in_rials)
+        return totals
+
     def get_total_price_in_rials(self, obj):
-        total = 0
-        for item in obj.cartitem_set.all():
-            print(item.product.price_after_discount_in_rials)
-            total += item.quantity * item.product.price_after_discount_in_rials
-        return total
+        return self.get_totals(obj)[1]
+
     def get_total_price(self, obj):
-        total = 0
-        for item in obj.cartitem_set.all():
-            print(item.product.price_after_discount)
-            total += item.quantity * item.product.price_after_discount
-        return total
-    
-
-            
-       
-    
+        return self.get_totals(obj)[0]
+
     class Meta:
         model = Cart
         fields = ['total_price','id', 'user', 'created_at', 'items','total_price_in_rials']  
 
 
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'update', 'remove'])
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, data):
+        if data['op'] == 'update' and 'quantity' not in data:
+            raise serializers.ValidationError({'quantity': ['This field is required.']})
+        if data['op'] == 'add':
+            data.setdefault('quantity', 1)
+        return data
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=500)
+
+    def validate_operations(self, operations):
+        product_ids = {operation['product_id'] for operation in operations if operation['op'] != 'remove'}
+        found = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+        errors = [{'product_id': ['Product not found.']}
+                  if operation['op'] != 'remove' and operation['product_id'] not in found else {}
+                  for operation in operations]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return operations
+
+
 
 class WishlistItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)  
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import WishlistItem
+from .wishlists import record_membership_on_commit
+
+@receiver(post_save, sender=WishlistItem)
+def wishlist_item_saved(sender, instance, created, **kwargs):
+    if created:
+        record_membership_on_commit(instance.wishlist.user_id, instance.product_id)
+
+@receiver(post_delete, sender=WishlistItem)
+def wishlist_item_deleted(sender, instance, **kwargs):
+    record_membership_on_commit(instance.wishlist.user_id, instance.product_id, added=False)
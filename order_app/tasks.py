@@ -1,12 +1,31 @@
+import logging
 from celery import shared_task
 from django.utils import timezone
 from datetime import timedelta
+from .carts import RedisCartBackend, get_cart_backend
 from .models import Order
 
+logger = logging.getLogger(__name__)
+
 @shared_task
-def update_delivery_status():
+def update_delivery_status(batch_size=1000, max_batches=50):
     seven_days_ago = timezone.now() - timedelta(days=7)
-    orders = Order.objects.filter(delivery_status='shipped', shipped_at__lte=seven_days_ago)
-    for order in orders:
-        order.delivery_status = 'delivered'
-        order.save()
\ No newline at end of file
+    due_orders = Order.objects.filter(delivery_status='shipped', shipped_at__lte=seven_days_ago)
+    updated = 0
+    for _ in range(max_batches):
+        batch = list(due_orders.order_by('shipped_at', 'id').values_list('id', flat=True)[:batch_size])
+        if not batch:
+            break
+        updated += due_orders.filter(id__in=batch).update(delivery_status='delivered')
+    logger.info(f"Marked {updated} shipped orders as delivered")
+    return updated
+
+
+@shared_task
+def flush_idle_carts(idle_seconds=600, limit=500):
+    carts = get_cart_backend()
+    if not isinstance(carts, RedisCartBackend):
+        return 0
+    flushed = carts.flush_idle(idle_seconds=idle_seconds, limit=limit)
+    logger.info(f"Wrote {flushed} idle carts back to the database")
+    return flushed
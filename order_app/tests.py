@@ -1,8 +1,24 @@
+import csv
+from unittest import mock
+import io
+import json
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import Order, OrderItem, Cart, CartItem
-from product_app.models import Product, Category
+from datetime import timedelta
+from django.utils import timezone
+from .models import Order, OrderItem, Cart, CartItem, Wishlist, WishlistItem
+from .carts import DatabaseCartBackend, RedisCartBackend, write_items
+from .tasks import flush_idle_carts, update_delivery_status
+from .wishlists import product_key, rebuild_wishlist_index, wishlisted_by, wishlisted_product_ids
+from Azonix.redis_client import get_redis
+from redis.exceptions import RedisError
+from product_app.leaderboard import top_sellers
+from product_app.models import Product, Category, SalesBucket
+from product_app.utils import notify_users
 from user_app.models import User
 
 class OrderTests(APITestCase):
@@ -121,4 +137,494 @@ class CartTests(APITestCase):
         url = reverse('user-cart', args=[self.user.id])
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data['items'][0]['product']['id'], self.product1.id)
\ No newline at end of file
+        self.assertEqual(response.data['items'][0]['product']['id'], self.product1.id)
+
+
+class StockReservationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='buyerpassword')
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Test Category', slugname='test-category')
+        self.product1 = Product.objects.create(name='Product 1', slugname='product-1', price=100, stock=10, category=self.category)
+        self.product2 = Product.objects.create(name='Product 2', slugname='product-2', price=200, stock=2, category=self.category)
+        CartItem.objects.create(cart=self.cart, product=self.product1, quantity=1)
+
+    def place_order(self, items):
+        data = {'delivery_address': '123 Test St', 'delivery_status': 'pending', 'order_items': items}
+        return self.client.post(reverse('order-list'), data, format='json')
+
+    def test_order_reserves_stock(self):
+        response = self.place_order([
+            {'product': self.product1.id, 'quantity': 2},
+            {'product': self.product2.id, 'quantity': 1},
+            {'product': self.product1.id, 'quantity': 3},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual((self.product1.stock, self.product1.sales_count), (5, 5))
+        self.assertEqual((self.product2.stock, self.product2.sales_count), (1, 1))
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 0)
+
+    def test_order_cannot_oversell(self):
+        response = self.place_order([
+            {'product': self.product1.id, 'quantity': 1},
+            {'product': self.product2.id, 'quantity': 3},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual((self.product1.stock, self.product2.stock), (10, 2))
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 1)
+
+    @override_settings(REDIS_URL='redis://127.0.0.1:6379/15')
+    def test_order_and_cancellation_update_leaderboard(self):
+        get_redis().flushdb()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.place_order([{'product': self.product1.id, 'quantity': 3}])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(top_sellers(), [(self.product1.id, 3)])
+        self.assertEqual(top_sellers(category=self.category.id, window='24h'), [(self.product1.id, 3)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.get().cancel_order()
+        self.assertEqual(top_sellers(window='24h'), [])
+
+    def test_cancel_order_restores_stock(self):
+        response = self.place_order([{'product': self.product2.id, 'quantity': 2}])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get()
+        with self.assertNumQueries(8):
+            self.assertTrue(order.cancel_order())
+        self.product2.refresh_from_db()
+        self.assertEqual((self.product2.stock, self.product2.sales_count), (2, 0))
+        self.assertEqual(SalesBucket.objects.get(product=self.product2).quantity, 0)
+        self.assertEqual(order.delivery_status, 'cancelled')
+        self.assertFalse(Order.objects.get().cancel_order())
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product2.stock, 2)
+
+    def test_cancel_order_keeps_concurrent_changes(self):
+        response = self.place_order([{'product': self.product2.id, 'quantity': 2}])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get()
+        Order.objects.filter(pk=order.pk).update(delivery_address='456 New St')
+        self.assertTrue(order.cancel_order())
+        order.refresh_from_db()
+        self.assertEqual((order.delivery_status, order.delivery_address), ('cancelled', '456 New St'))
+
+    def test_cancel_order_notifies_when_back_in_stock(self):
+        response = self.place_order([{'product': self.product2.id, 'quantity': 2}])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with mock.patch('product_app.tasks.notify_back_in_stock.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('order-cancel', args=[Order.objects.get().id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        delay.assert_called_once()
+        self.assertEqual(delay.call_args[0][0], self.product2.id)
+
+
+class OrderItemBatchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='buyerpassword')
+        self.client.force_authenticate(self.user)
+        Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Test Category', slugname='test-category')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', slugname=f'product-{i}', price=10 * (i + 1), stock=100, category=self.category)
+            for i in range(6)
+        ]
+
+    def test_create_inserts_items_in_one_statement(self):
+        items = [{'product': product.id, 'quantity': 2} for product in self.products]
+        data = {'delivery_address': '123 Test St', 'delivery_status': 'pending', 'order_items': items}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('order-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT INTO "order_app_orderitem"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(OrderItem.objects.count(), 6)
+
+    def test_update_applies_item_diff(self):
+        order = Order.objects.create(user=self.user, delivery_address='123 Test St', delivery_status='pending')
+        kept = OrderItem.objects.create(order=order, product=self.products[0], quantity=1)
+        changed = OrderItem.objects.create(order=order, product=self.products[1], quantity=1)
+        OrderItem.objects.create(order=order, product=self.products[2], quantity=1)
+
+        items = [
+            {'product': self.products[0].id, 'quantity': 1},
+            {'product': self.products[1].id, 'quantity': 4},
+            {'product': self.products[3].id, 'quantity': 2},
+        ]
+        response = self.client.patch(reverse('order-detail', args=[order.id]), {'order_items': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        quantities = dict(order.order_items.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {self.products[0].id: 1, self.products[1].id: 4, self.products[3].id: 2})
+        self.assertTrue(OrderItem.objects.filter(id=kept.id).exists())
+        self.assertEqual(OrderItem.objects.get(id=changed.id).quantity, 4)
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, 10 + 20 * 4 + 40 * 2)
+
+
+class DeliveryStatusTaskTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='buyerpassword')
+        old = timezone.now() - timedelta(days=8)
+        recent = timezone.now() - timedelta(days=1)
+        for shipped_at in [old, old, old, recent]:
+            Order.objects.create(user=self.user, delivery_address='123 Test St', delivery_status='shipped', shipped_at=shipped_at)
+        Order.objects.create(user=self.user, delivery_address='123 Test St', delivery_status='pending')
+
+    def test_marks_old_shipped_orders_delivered_in_batches(self):
+        self.assertEqual(update_delivery_status(batch_size=2, max_batches=1), 2)
+        self.assertEqual(update_delivery_status(batch_size=2), 1)
+        self.assertEqual(update_delivery_status(batch_size=2), 0)
+        self.assertEqual(Order.objects.filter(delivery_status='delivered').count(), 3)
+        self.assertEqual(Order.objects.filter(delivery_status='shipped').count(), 1)
+
+
+class OrderExportTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='adminpassword', email='admin@example.com', is_staff=True)
+        self.buyer = User.objects.create_user(username='buyer', password='buyerpassword', email='buyer@example.com')
+        self.category = Category.objects.create(name='Test Category', slugname='test-category')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', slugname=f'product-{i}', price=10 * (i + 1), stock=100, category=self.category)
+            for i in range(3)
+        ]
+        for i in range(4):
+            order = Order.objects.create(user=self.buyer, delivery_address='123 Test St', delivery_status='pending', total_price=30)
+            OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=i + 1) for product in self.products[:2]])
+        Order.objects.create(user=self.admin, delivery_address='1 Admin St', delivery_status='cancelled')
+        self.url = reverse('order-export')
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_csv_export_streams_one_row_per_item(self):
+        self.client.force_authenticate(self.admin)
+        with CaptureQueriesContext(connection) as context:
+            rows = list(csv.DictReader(io.StringIO(self.export())))
+        self.assertEqual(len(rows), 9)
+        self.assertLessEqual(len(context.captured_queries), 4)
+        self.assertEqual({row['username'] for row in rows}, {'buyer', 'admin'})
+        self.assertEqual([row['product_id'] for row in rows if row['username'] == 'admin'], [''])
+        self.assertEqual({row['product_slugname'] for row in rows if row['username'] == 'buyer'}, {'product-0', 'product-1'})
+
+    def test_cursor_rejects_nullable_ordering(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('order-list'), {'pagination': 'cursor', 'ordering': 'delivery_date'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('order-list'), {'pagination': 'cursor', 'ordering': 'order_date'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_jsonl_export_applies_filters(self):
+        self.client.force_authenticate(self.admin)
+        lines = self.export(file_format='jsonl', delivery_status='cancelled').splitlines()
+        self.assertEqual([json.loads(line)['email'] for line in lines], ['admin@example.com'])
+
+
+class CartReadTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shopper', password='shopperpassword')
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Test Category', slugname='test-category')
+        self.url = reverse('cart-retrieve-cart', args=[self.user.id])
+
+    def add_products(self, start, count):
+        for i in range(start, start + count):
+            product = Product.objects.create(name=f'Product {i}', slugname=f'product-{i}', price=10 * (i + 1), stock=10, category=self.category)
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+
+    def test_query_count_does_not_grow_with_items(self):
+        self.add_products(0, 2)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.add_products(2, 4)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data['items']), 6)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_totals(self):
+        self.add_products(0, 3)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['total_price'], 2 * (10 + 20 + 30))
+        self.assertEqual(response.data['total_price_in_rials'], sum(
+            item.quantity * item.product.price_after_discount_in_rials for item in self.cart.cartitem_set.all()
+        ))
+
+
+class CartBatchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shopper', password='shopperpassword')
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Test Category', slugname='test-category')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', slugname=f'product-{i}', price=10 * (i + 1), stock=10, category=self.category)
+            for i in range(4)
+        ]
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=1)
+        self.url = reverse('cart-batch')
+
+    def quantities(self):
+        return dict(self.cart.cartitem_set.values_list('product_id', 'quantity'))
+
+    def test_applies_operations_in_order(self):
+        operations = [
+            {'op': 'add', 'product_id': self.products[0].id, 'quantity': 2},
+            {'op': 'remove', 'product_id': self.products[1].id},
+            {'op': 'add', 'product_id': self.products[2].id},
+            {'op': 'add', 'product_id': self.products[3].id, 'quantity': 4},
+            {'op': 'update', 'product_id': self.products[3].id, 'quantity': 2},
+        ]
+        response = self.client.post(self.url, {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = {self.products[0].id: 3, self.products[2].id: 1, self.products[3].id: 2}
+        self.assertEqual(self.quantities(), expected)
+        self.assertEqual({item['product']['id']: item['quantity'] for item in response.data['cart']['items']}, expected)
+
+    def test_query_count_does_not_grow_with_operations(self):
+        def run(operations):
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.post(self.url, {'operations': operations}, format='json').status_code, status.HTTP_200_OK)
+            return len(context.captured_queries)
+        few = run([{'op': 'add', 'product_id': self.products[0].id}, {'op': 'add', 'product_id': self.products[2].id}])
+        many = run([{'op': 'add', 'product_id': product.id} for product in self.products] * 5)
+        self.assertEqual(few, many)
+
+    def test_new_rows_upsert_over_concurrent_adds(self):
+        # An add() from another request inserted this row after the batch locked the cart's items.
+        CartItem.objects.create(cart=self.cart, product=self.products[2], quantity=5)
+        existing = {item.product_id: item for item in CartItem.objects.filter(cart=self.cart, product__in=self.products[:2])}
+        write_items(self.cart.id, existing, {self.products[0].id: 1, self.products[2].id: 2})
+        self.assertEqual(self.quantities(), {self.products[0].id: 1, self.products[2].id: 2})
+
+    def test_one_cart_per_user(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(user=self.user)
+
+    def test_rejects_unknown_product(self):
+        operations = [{'op': 'add', 'product_id': self.products[2].id}, {'op': 'add', 'product_id': 999999}]
+        response = self.client.post(self.url, {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['operations'][1]['product_id'], ['Product not found.'])
+        self.assertEqual(self.quantities(), {self.products[0].id: 1, self.products[1].id: 1})
+
+    def test_rejects_missing_item_without_changes(self):
+        operations = [{'op': 'remove', 'product_id': self.products[0].id}, {'op': 'update', 'product_id': self.products[3].id, 'quantity': 2}]
+        response = self.client.post(self.url, {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['operations'], [{}, {'product_id': ['Product is not in the cart.']}])
+        self.assertEqual(self.quantities(), {self.products[0].id: 1, self.products[1].id: 1})
+
+
+class CartItemUpsertTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shopper', password='shopperpassword')
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Test Category', slugname='test-category')
+        self.product = Product.objects.create(name='Product 1', slugname='product-1', price=100, stock=10, category=self.category)
+        self.carts = DatabaseCartBackend()
+
+    def test_add_is_a_single_upsert(self):
+        self.carts.add(self.user.id, self.product.id, 2)
+        with self.assertNumQueries(2):
+            self.carts.add(self.user.id, self.product.id, 3)
+        self.assertEqual(list(CartItem.objects.values_list('product_id', 'quantity')), [(self.product.id, 5)])
+
+    def test_add_to_cart_endpoint_increments(self):
+        for quantity in (1, 4):
+            response = self.client.post(reverse('cart-add-to-cart'), {'product_id': self.product.id, 'quantity': quantity}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['quantity'] for item in response.data['cart']['items']], [5])
+
+    def test_duplicate_items_are_rejected(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        with self.assertRaises(IntegrityError):
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+
+
+@override_settings(REDIS_URL='redis://127.0.0.1:6379/15', CART_BACKEND='order_app.carts.RedisCartBackend')
+class RedisCartTests(APITestCase):
+    def setUp(self):
+        get_redis().flushdb()
+        self.user = User.objects.create_user(username='shopper', password='shopperpassword')
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Test Category', slugname='test-category')
+        self.product1 = Product.objects.create(name='Product 1', slugname='product-1', price=100, stock=10, category=self.category)
+        self.product2 = Product.objects.create(name='Product 2', slugname='product-2', price=200, stock=10, category=self.category)
+        self.carts = RedisCartBackend()
+
+    def add(self, product, quantity):
+        return self.client.post(reverse('cart-add-to-cart'), {'product_id': product.id, 'quantity': quantity}, format='json')
+
+    def test_writes_stay_in_redis_until_flushed(self):
+        self.assertEqual(self.add(self.product1, 2).status_code, status.HTTP_201_CREATED)
+        response = self.add(self.product1, 1)
+        self.assertEqual(response.data['cart']['items'][0]['quantity'], 3)
+        self.assertEqual(response.data['cart']['total_price'], 300)
+        cart = Cart.objects.get(user=self.user)
+        self.assertFalse(cart.cartitem_set.exists())
+
+        self.add(self.product2, 1)
+        url = reverse('cart-update-cart-item', args=[self.user.id, self.product1.id])
+        self.assertEqual(self.client.put(url, {'quantity': 5}, format='json').status_code, status.HTTP_200_OK)
+        self.assertEqual(flush_idle_carts(idle_seconds=0), 1)
+        self.assertEqual(dict(cart.cartitem_set.values_list('product_id', 'quantity')), {self.product1.id: 5, self.product2.id: 1})
+        self.assertEqual(flush_idle_carts(idle_seconds=0), 0)
+
+        self.client.delete(reverse('cart-delete-cart-item', args=[self.user.id, self.product2.id]))
+        self.assertEqual(flush_idle_carts(idle_seconds=3600), 0)
+        self.carts.flush(self.user.id)
+        self.assertEqual(dict(cart.cartitem_set.values_list('product_id', 'quantity')), {self.product1.id: 5})
+
+    def test_hash_without_id_is_reloaded(self):
+        self.add(self.product1, 2)
+        key = self.carts.cart_key(self.user.id)
+        get_redis().delete(key)
+        get_redis().hincrby(key, f'{self.carts.item_prefix}{self.product2.id}', 1)
+        self.assertEqual(flush_idle_carts(idle_seconds=0), 1)
+        self.assertEqual(get_redis().zcard(self.carts.dirty_key), 0)
+        response = self.client.get(reverse('cart-retrieve-cart', args=[self.user.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user'], self.user.id)
+        self.assertEqual(response.data['items'], [])
+
+    def test_writes_to_a_cleared_cart_reload_it_first(self):
+        self.add(self.product1, 2)
+        key = self.carts.cart_key(self.user.id)
+        get_redis().delete(key)
+        self.assertFalse(self.carts.update(self.user.id, self.product1.id, 5))
+        self.assertIn('id', get_redis().hgetall(key))
+        get_redis().delete(key)
+        self.carts.add(self.user.id, self.product2.id, 1)
+        data = get_redis().hgetall(key)
+        self.assertEqual(int(data['id']), Cart.objects.get(user=self.user).id)
+        self.assertEqual(self.carts.items(data), {self.product2.id: 1})
+
+    def test_existing_database_cart_is_loaded(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product1, quantity=2)
+        response = self.client.get(reverse('cart-retrieve-cart', args=[self.user.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], cart.id)
+        self.assertEqual([item['quantity'] for item in response.data['items']], [2])
+        missing = reverse('cart-update-cart-item', args=[self.user.id, self.product2.id])
+        self.assertEqual(self.client.put(missing, {'quantity': 1}, format='json').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_checkout_clears_redis_cart(self):
+        self.add(self.product1, 2)
+        data = {'delivery_address': '123 Test St', 'delivery_status': 'pending', 'order_items': [{'product': self.product1.id, 'quantity': 2}]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('order-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(get_redis().exists(self.carts.cart_key(self.user.id)))
+        self.assertEqual(get_redis().zcard(self.carts.dirty_key), 0)
+        self.assertEqual(self.client.get(reverse('cart-retrieve-cart', args=[self.user.id])).data['items'], [])
+
+    def test_flush_after_checkout_clear_does_not_restore_items(self):
+        self.add(self.product1, 2)
+        cart = Cart.objects.get(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.carts.clear(self.user.id)
+            # A flush queued behind checkout's lock runs once the clear is done.
+            self.carts.flush(self.user.id)
+        self.assertFalse(cart.cartitem_set.exists())
+        self.assertEqual(self.carts.get_cart(self.user.id).items, [])
+
+    def test_batch(self):
+        self.add(self.product1, 1)
+        operations = [{'op': 'add', 'product_id': self.product2.id, 'quantity': 3}, {'op': 'remove', 'product_id': self.product1.id}]
+        response = self.client.post(reverse('cart-batch'), {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(item['product']['id'], item['quantity']) for item in response.data['cart']['items']], [(self.product2.id, 3)])
+        self.carts.flush(self.user.id)
+        self.assertEqual(dict(CartItem.objects.values_list('product_id', 'quantity')), {self.product2.id: 3})
+
+
+@override_settings(REDIS_URL='redis://127.0.0.1:6379/15')
+class WishlistIndexTests(APITestCase):
+    def setUp(self):
+        get_redis().flushdb()
+        self.user = User.objects.create_user(username='shopper', password='shopperpassword')
+        self.other = User.objects.create_user(username='other', password='otherpassword')
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Test Category', slugname='test-category')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', slugname=f'product-{i}', price=10 * (i + 1), stock=10, category=self.category)
+            for i in range(3)
+        ]
+        WishlistItem.objects.create(wishlist=Wishlist.objects.create(user=self.other), product=self.products[0])
+
+    def add(self, product):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('wishlist-add-to-wishlist', args=[self.user.id]), {'product_id': product.id}, format='json')
+
+    def test_falls_back_to_database_until_rebuilt(self):
+        self.add(self.products[1])
+        self.assertIsNone(wishlisted_by(self.products[0].id))
+        self.assertEqual(wishlisted_product_ids(self.user.id, [product.id for product in self.products]), {self.products[1].id})
+        rebuild_wishlist_index()
+        self.assertEqual(wishlisted_by(self.products[0].id), {self.other.id})
+        with self.assertNumQueries(0):
+            self.assertEqual(wishlisted_product_ids(self.user.id, [product.id for product in self.products]), {self.products[1].id})
+
+    def test_add_and_remove_keep_index_in_sync(self):
+        rebuild_wishlist_index()
+        self.assertEqual(self.add(self.products[0]).status_code, status.HTTP_201_CREATED)
+        self.add(self.products[2])
+        self.assertEqual(wishlisted_by(self.products[0].id), {self.user.id, self.other.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('wishlist-remove-from-wishlist', args=[self.user.id, self.products[0].id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(wishlisted_by(self.products[0].id), {self.other.id})
+        self.assertEqual(wishlisted_product_ids(self.user.id, [product.id for product in self.products]), {self.products[2].id})
+
+    def test_product_list_flag(self):
+        self.add(self.products[1])
+        rebuild_wishlist_index()
+        response = self.client.get(reverse('product-list'), {'with_wishlist': 1})
+        self.assertEqual({item['id']: item['in_wishlist'] for item in response.json()['results']},
+                         {self.products[0].id: False, self.products[1].id: True, self.products[2].id: False})
+        response = self.client.get(reverse('product-detail', args=[self.products[1].id]), {'with_wishlist': 1})
+        self.assertTrue(response.json()['in_wishlist'])
+        self.assertNotIn('in_wishlist', self.client.get(reverse('product-list')).json()['results'][0])
+
+    def test_model_writes_keep_index_in_sync(self):
+        rebuild_wishlist_index()
+        wishlist = Wishlist.objects.get(user=self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            WishlistItem.objects.create(wishlist=wishlist, product=self.products[1])
+        self.assertEqual(wishlisted_by(self.products[1].id), {self.other.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            wishlist.delete()
+        self.assertEqual(wishlisted_by(self.products[0].id), set())
+        self.assertEqual(wishlisted_by(self.products[1].id), set())
+
+    def test_failed_index_write_falls_back_to_database(self):
+        rebuild_wishlist_index()
+        with mock.patch('redis.client.Pipeline.execute', side_effect=RedisError('down')):
+            self.add(self.products[1])
+        self.assertIsNone(wishlisted_by(self.products[1].id))
+        self.assertEqual(wishlisted_product_ids(self.user.id, [product.id for product in self.products]), {self.products[1].id})
+
+    def test_notify_users_does_not_trust_the_index(self):
+        User.objects.filter(pk=self.other.pk).update(email='other@example.com')
+        rebuild_wishlist_index()
+        get_redis().delete(product_key(self.products[0].id))
+        self.assertEqual(notify_users(self.products[0], timezone.now()), 1)
@@ -6,20 +6,28 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.parsers import JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import *
-from .serializers import OrderSerializer, CartSerializer,WishlistSerializer
+from .serializers import OrderSerializer, CartSerializer, CartBatchSerializer,WishlistSerializer
 from product_app.models import Product
+from product_app.caching import invalidate_response_cache_on_commit, product_cache_tags
+from product_app.leaderboard import record_order_sales
 from rest_framework.permissions import IsAuthenticated,IsAuthenticatedOrReadOnly,IsAdminUser
 from .permissions import IsOwnerOrAdmin
 from django.db import  transaction
+from django.db.models import F
 from django.shortcuts import get_object_or_404
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.decorators import action
 from django.utils import timezone
+from Azonix.pagination import KeysetPaginationMixin
+from Azonix.streaming import CONTENT_TYPES, streaming_response
+from .carts import get_cart_backend
+from .exports import EXPORT_FIELDS, export_rows
 logger = logging.getLogger(__name__)
 
 
-class CustomPageNumberPagination(PageNumberPagination):
+class CustomPageNumberPagination(KeysetPaginationMixin, PageNumberPagination):
     page_size_query_param = 'page_size'
+    keyset_ordering = ('-order_date', '-id')
 
     def get_paginated_response(self, data):
         return Response({
@@ -54,24 +62,40 @@ class OrderViewSet(viewsets.ModelViewSet):
         return queryset
 
     def perform_create(self, serializer):
+        quantities = {}
+        for item_data in serializer.validated_data.get('order_items', []):
+            product_id = item_data['product'].id
+            quantities[product_id] = quantities.get(product_id, 0) + item_data['quantity']
+
         with transaction.atomic():
+            products = self.reserve_stock(quantities)
+            sales = [(product_id, products[product_id].category_id, products[product_id].subcategory_id, quantity)
+                     for product_id, quantity in quantities.items()]
+            record_order_sales(sales)
+            invalidate_response_cache_on_commit(*(tag for product in products.values() for tag in product_cache_tags(
+                product.id, product.category_id, product.subcategory_id,
+            )))
             order = serializer.save(user=self.request.user)
-            total_price = 0
-            cart = Cart.objects.get(user=self.request.user)
-            for item_data in self.request.data.get('order_items', []):
-                product = Product.objects.get(id=item_data['product'])
-                quantity = item_data['quantity']
-                if product.stock < quantity:
-                    raise ValidationError(f"Not enough stock for {product.name}.")
-                #OrderItem.objects.create(order=order, product=product, quantity=quantity)
-                product.stock -= quantity
-                product.sales_count += quantity
-                product.save()
-                total_price += product.price * quantity
-            order.total_price = total_price
+            order.total_price = sum(products[product_id].price * quantity for product_id, quantity in quantities.items())
             order.save()
 
-            cart.cartitem_set.all().delete()
+            get_cart_backend().clear(self.request.user.id)
+
+    def reserve_stock(self, quantities):
+        products = Product.objects.select_for_update().filter(id__in=quantities).order_by('id').in_bulk()
+        now = timezone.now()
+        for product_id, quantity in quantities.items():
+            product = products[product_id]
+            if product.stock < quantity:
+                raise ValidationError(f"Not enough stock for {product.name}.")
+            updated = Product.objects.filter(id=product_id, stock__gte=quantity).update(
+                stock=F('stock') - quantity,
+                sales_count=F('sales_count') + quantity,
+                updated_at=now,
+            )
+            if not updated:
+                raise ValidationError(f"Not enough stock for {product.name}.")
+        return products
 
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
@@ -90,12 +114,21 @@ class OrderViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in CONTENT_TYPES:
+            return Response({"detail": f"Invalid file_format. Choose one of: {', '.join(CONTENT_TYPES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.filter_queryset(self.get_queryset())
+        return streaming_response(file_format, EXPORT_FIELDS, export_rows(queryset), 'orders')
+
     @action(detail=True, methods=['post'], permission_classes=[IsOwnerOrAdmin])
     def cancel(self, request, pk=None):
         try:
             order = self.get_object()
-            if order.delivery_status != 'cancelled':
-                order.cancel_order()
+            with transaction.atomic():
+                cancelled = order.delivery_status != 'cancelled' and order.cancel_order()
+            if cancelled:
                 return Response({"detail": "Order cancelled successfully."}, status=status.HTTP_200_OK)
             else:
                 return Response({"detail": "Order is already cancelled."}, status=status.HTTP_400_BAD_REQUEST)
@@ -108,10 +141,6 @@ class CartViewSet(viewsets.ViewSet):
     authentication_classes = [JWTAuthentication]
     parser_classes = [JSONParser]
 
-    def get_cart(self, user):
-        cart, created = Cart.objects.get_or_create(user=user)
-        return cart
-
     def get_serializer_context(self):
         return {'request': self.request}
 
@@ -135,73 +164,89 @@ class CartViewSet(viewsets.ViewSet):
             return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            with transaction.atomic():
-                cart = self.get_cart(user)
-                cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-                cart_item.quantity += quantity
-                cart_item.save()
-                cart_serializer = self.get_serializer(cart)
+            carts = get_cart_backend()
+            carts.add(user.id, product.id, quantity)
+            cart_serializer = self.get_serializer(carts.get_cart(user.id))
+            return Response({
+                "detail": "Product added to cart.",
+                "cart": cart_serializer.data
+            }, status=status.HTTP_201_CREATED)
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['post'], url_path='batch', permission_classes=[IsAuthenticated])
+    def batch(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        operations = serializer.validated_data['operations']
+
+        try:
+            carts = get_cart_backend()
+            errors = carts.apply_batch(request.user.id, operations)
+            if errors:
                 return Response({
-                    "detail": "Product added to cart.",
-                    "cart": cart_serializer.data
-                }, status=status.HTTP_201_CREATED)
+                    "detail": "No changes were applied.",
+                    "operations": [{"product_id": [errors[index]]} if index in errors else {} for index in range(len(operations))]
+                }, status=status.HTTP_400_BAD_REQUEST)
+            cart_serializer = self.get_serializer(carts.get_cart(request.user.id))
+            return Response({
+                "detail": "Cart updated.",
+                "cart": cart_serializer.data
+            }, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=True, methods=['get'], url_path='view-item/(?P<product_id>[^/.]+)', permission_classes=[IsAuthenticated])
     def retrieve_cart_item(self, request, pk=None, product_id=None):
         try:
-            cart_item = CartItem.objects.get(cart__user_id=pk, product_id=product_id)
-            cart_serializer = self.get_serializer(cart_item.cart)
+            carts = get_cart_backend()
+            if not carts.has_item(pk, product_id):
+                return Response({"detail": "Cart item not found."}, status=status.HTTP_404_NOT_FOUND)
+            cart_serializer = self.get_serializer(carts.get_cart(pk))
             return Response(cart_serializer.data, status=status.HTTP_200_OK)
-        except CartItem.DoesNotExist:
-            return Response({"detail": "Cart item not found."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=True, methods=['put', 'patch'], url_path='update-item/(?P<product_id>[^/.]+)', permission_classes=[IsAuthenticated])
     def update_cart_item(self, request, pk=None, product_id=None):
         try:
-            cart_item = CartItem.objects.get(cart__user_id=pk, product_id=product_id)
             quantity = request.data.get('quantity')
             if quantity is None or quantity <= 0:
                 return Response({"detail": "Invalid quantity."}, status=status.HTTP_400_BAD_REQUEST)
-            cart_item.quantity = quantity
-            cart_item.save()
-            cart_serializer = self.get_serializer(cart_item.cart)
+            carts = get_cart_backend()
+            if not carts.update(pk, product_id, quantity):
+                return Response({"detail": "Cart item not found."}, status=status.HTTP_404_NOT_FOUND)
+            cart_serializer = self.get_serializer(carts.get_cart(pk))
             return Response({
                 "detail": "Cart item updated.",
                 "cart": cart_serializer.data
             }, status=status.HTTP_200_OK)
-        except CartItem.DoesNotExist:
-            return Response({"detail": "Cart item not found."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=True, methods=['delete'], url_path='remove-item/(?P<product_id>[^/.]+)', permission_classes=[IsAuthenticated])
     def delete_cart_item(self, request, pk=None, product_id=None):
         try:
-            cart_item = CartItem.objects.get(cart__user_id=pk, product_id=product_id)
-            cart = cart_item.cart
-            cart_item.delete()
-            cart_serializer = self.get_serializer(cart)
+            carts = get_cart_backend()
+            if not carts.remove(pk, product_id):
+                return Response({"detail": "Cart item not found."}, status=status.HTTP_404_NOT_FOUND)
+            cart_serializer = self.get_serializer(carts.get_cart(pk))
             return Response({
                 "detail": "Product removed from cart.",
                 "cart": cart_serializer.data
             }, status=status.HTTP_204_NO_CONTENT)
-        except CartItem.DoesNotExist:
-            return Response({"detail": "Cart item not found."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=True, methods=['get'], url_path='view-cart', permission_classes=[IsAuthenticated])
     def retrieve_cart(self, request, pk=None):
         try:
-            cart = Cart.objects.get(user_id=pk)
+            cart = get_cart_backend().get_cart(pk)
+            if cart is None:
+                return Response({"detail": "Cart not found."}, status=status.HTTP_404_NOT_FOUND)
             cart_serializer = self.get_serializer(cart)
             return Response(cart_serializer.data, status=status.HTTP_200_OK)
-        except Cart.DoesNotExist:
-            return Response({"detail": "Cart not found."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -0,0 +1,91 @@
+import logging
+from django.db import transaction
+from redis.exceptions import RedisError
+from Azonix.redis_client import get_redis
+from .models import WishlistItem
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'wishlist'
+READY_KEY = f'{KEY_PREFIX}:ready'
+
+
+def user_key(user_id):
+    return f'{KEY_PREFIX}:user:{user_id}'
+
+
+def product_key(product_id):
+    return f'{KEY_PREFIX}:product:{product_id}'
+
+
+def record_membership(user_id, product_id, added=True):
+    # Called once the wishlist change commits. A write that fails leaves the
+    # index stale, so it is marked not ready and reads use WishlistItem until
+    # rebuild_wishlist_index() runs.
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        if added:
+            pipeline.sadd(user_key(user_id), product_id)
+            pipeline.sadd(product_key(product_id), user_id)
+        else:
+            pipeline.srem(user_key(user_id), product_id)
+            pipeline.srem(product_key(product_id), user_id)
+        pipeline.execute()
+    except RedisError as e:
+        logger.error(f"Error updating wishlist index for user {user_id}, product {product_id}: {str(e)}")
+        try:
+            get_redis().delete(READY_KEY)
+        except RedisError as e:
+            logger.error(f"Error marking the wishlist index stale: {str(e)}")
+
+
+def record_membership_on_commit(user_id, product_id, added=True):
+    transaction.on_commit(lambda: record_membership(user_id, product_id, added))
+
+
+def wishlisted_product_ids(user_id, product_ids):
+    # Which of product_ids the user has wishlisted: one SMISMEMBER for the whole
+    # page, or one indexed query while the index hasn't been built.
+    product_ids = list(product_ids)
+    if not product_ids:
+        return set()
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.exists(READY_KEY)
+        pipeline.smismember(user_key(user_id), product_ids)
+        ready, members = pipeline.execute()
+        if ready:
+            return {product_id for product_id, member in zip(product_ids, members) if member}
+    except RedisError as e:
+        logger.error(f"Error reading wishlist index for user {user_id}: {str(e)}")
+    return set(WishlistItem.objects.filter(
+        wishlist__user_id=user_id, product_id__in=product_ids,
+    ).values_list('product_id', flat=True))
+
+
+def wishlisted_by(product_id):
+    # User ids with product_id in their wishlist, or None if the index can't answer.
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.exists(READY_KEY)
+        pipeline.smembers(product_key(product_id))
+        ready, members = pipeline.execute()
+        if ready:
+            return {int(user_id) for user_id in members}
+    except RedisError as e:
+        logger.error(f"Error reading wishlist index for product {product_id}: {str(e)}")
+    return None
+
+
+def rebuild_wishlist_index():
+    client = get_redis()
+    client.delete(READY_KEY)
+    stale = list(client.scan_iter(f'{KEY_PREFIX}:*'))
+    if stale:
+        client.delete(*stale)
+    pipeline = client.pipeline(transaction=False)
+    for user_id, product_id in WishlistItem.objects.values_list('wishlist__user_id', 'product_id').iterator():
+        pipeline.sadd(user_key(user_id), product_id)
+        pipeline.sadd(product_key(product_id), user_id)
+    pipeline.set(READY_KEY, 1)
+    pipeline.execute()
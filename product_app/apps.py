@@ -7,4 +7,4 @@ class ProductAppConfig(AppConfig):
 
 
     def ready(self):
-        import product_app.signals
\ No newline at end of file
+        import product_app.signals
@@ -0,0 +1,166 @@
+import logging
+from functools import reduce
+from operator import or_
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+from Azonix.streaming import read_rows
+from .caching import invalidate_response_cache
+from .models import Category, Product, Subcategory
+from .serializers import ProductImportSerializer
+from .utils import RIAL_RATE, update_search_vectors
+
+logger = logging.getLogger(__name__)
+
+ProductTranslation = Product._parler_meta.root_model
+LANGUAGES = ('en', 'fa')
+EXPORT_FIELDS = [
+    'id', 'slugname', 'name_en', 'description_en', 'name_fa', 'description_fa', 'brand',
+    'price', 'discount_percentage', 'price_after_discount', 'price_in_rials', 'price_after_discount_in_rials',
+    'stock', 'category', 'subcategory',
+]
+
+
+def file_format_for(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def import_products(stream, file_format='csv', chunk_size=1000):
+    # Rows are validated and inserted chunk by chunk; invalid rows are reported
+    # with their line number and never stop the rest of the file.
+    report = {'created': 0, 'errors': []}
+    context = {
+        'categories': dict(Category.objects.values_list('slugname', 'id')),
+        'subcategories': {slug: (pk, category_id) for slug, pk, category_id
+                          in Subcategory.objects.values_list('slugname', 'id', 'category_id')},
+    }
+    chunk = []
+    for number, row in read_rows(stream, file_format):
+        chunk.append((number, row))
+        if len(chunk) >= chunk_size:
+            import_chunk(chunk, context, report)
+            chunk = []
+    if chunk:
+        import_chunk(chunk, context, report)
+    report['errors'].sort(key=lambda error: error['row'])
+    if report['created']:
+        invalidate_response_cache('products')
+    logger.info(f"Imported {report['created']} products, {len(report['errors'])} rows rejected")
+    return report
+
+
+def import_chunk(chunk, context, report):
+    valid = []
+    for number, row in chunk:
+        if isinstance(row, Exception):
+            report['errors'].append({'row': number, 'errors': {'non_field_errors': [str(row)]}})
+            continue
+        data = {key: value for key, value in row.items() if key and value not in ('', None)}
+        serializer = ProductImportSerializer(data=data, context=context)
+        if not serializer.is_valid():
+            report['errors'].append({'row': number, 'errors': serializer.errors})
+            continue
+        valid.append((number, dict(serializer.validated_data)))
+
+    valid = assign_unique_slugs_and_names(valid, report)
+    if not valid:
+        return
+
+    products = [build_product(data) for _, data in valid]
+    try:
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            ProductTranslation.objects.bulk_create([
+                ProductTranslation(master_id=product.id, language_code=language,
+                                   name=data[f'name_{language}'], description=data.get(f'description_{language}'))
+                for product, (_, data) in zip(products, valid)
+                for language in LANGUAGES if data.get(f'name_{language}')
+            ])
+            update_search_vectors(Product.objects.filter(id__in=[product.id for product in products]))
+    except IntegrityError as e:
+        logger.error(f"Error importing products from rows {valid[0][0]}-{valid[-1][0]}: {str(e)}")
+        for number, _ in valid:
+            report['errors'].append({'row': number, 'errors': {'non_field_errors': [f'Could not be saved: {str(e)}']}})
+        return
+    report['created'] += len(products)
+
+
+def assign_unique_slugs_and_names(valid, report):
+    slugs = {data['slugname'] for _, data in valid if 'slugname' in data}
+    bases = {slugify(data['name_en']) for _, data in valid if 'slugname' not in data} - {''}
+    names = {data[f'name_{language}'] for _, data in valid for language in LANGUAGES if data.get(f'name_{language}')}
+
+    slug_filter = Q(slugname__in=slugs)
+    if bases:
+        slug_filter |= reduce(or_, (Q(slugname__startswith=f'{base}-') | Q(slugname=base) for base in bases))
+    taken_slugs = set(Product.objects.filter(slug_filter).values_list('slugname', flat=True))
+    taken_names = set(ProductTranslation.objects.filter(name__in=names).values_list('name', flat=True))
+
+    accepted = []
+    for number, data in valid:
+        errors = {}
+        row_names = [data[f'name_{language}'] for language in LANGUAGES if data.get(f'name_{language}')]
+        for language in LANGUAGES:
+            if data.get(f'name_{language}') in taken_names:
+                errors[f'name_{language}'] = ['A product with this name already exists.']
+        if len(set(row_names)) != len(row_names):
+            errors['name_fa'] = ['Names must differ between languages.']
+
+        if 'slugname' in data:
+            if data['slugname'] in taken_slugs:
+                errors['slugname'] = ['A product with this slug already exists.']
+        elif not errors:
+            base = slugify(data['name_en'])
+            if not base:
+                errors['slugname'] = ['A slug could not be generated from the English name.']
+            else:
+                slug, counter = base, 1
+                while slug in taken_slugs:
+                    slug = f'{base}-{counter}'
+                    counter += 1
+                data['slugname'] = slug
+
+        if errors:
+            report['errors'].append({'row': number, 'errors': errors})
+            continue
+        taken_slugs.add(data['slugname'])
+        taken_names.update(row_names)
+        accepted.append((number, data))
+    return accepted
+
+
+def build_product(data):
+    price = data['price']
+    discount = data['discount_percentage']
+    price_after_discount = price * (1 - discount / 100.0) if discount else price
+    return Product(
+        slugname=data['slugname'],
+        brand=data['brand'],
+        price=price,
+        discount_percentage=discount,
+        price_after_discount=price_after_discount,
+        price_in_rials=price * RIAL_RATE,
+        price_after_discount_in_rials=price_after_discount * RIAL_RATE,
+        stock=data['stock'],
+        category_id=data['category'],
+        subcategory_id=data.get('subcategory'),
+    )
+
+
+def export_rows(queryset=None, chunk_size=1000):
+    if queryset is None:
+        queryset = Product.objects.all()
+    queryset = queryset.select_related('category', 'subcategory').prefetch_related('translations').order_by('id')
+    for product in queryset.iterator(chunk_size=chunk_size):
+        translations = {translation.language_code: translation for translation in product.translations.all()}
+        row = {field: getattr(product, field) for field in (
+            'id', 'slugname', 'brand', 'price', 'discount_percentage', 'price_after_discount',
+            'price_in_rials', 'price_after_discount_in_rials', 'stock',
+        )}
+        for language in LANGUAGES:
+            translation = translations.get(language)
+            row[f'name_{language}'] = translation.name if translation else None
+            row[f'description_{language}'] = translation.description if translation else None
+        row['category'] = product.category.slugname
+        row['subcategory'] = product.subcategory.slugname if product.subcategory else None
+        yield row
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.translation import get_language
+from .models import Category, Subcategory
+
+CATEGORY_TREE_VERSION_KEY = 'category_tree:version'
+CATEGORY_TREE_TIMEOUT = 60 * 60 * 24
+
+
+def build_category_tree():
+    subcategories = Subcategory.objects.prefetch_related('translations').order_by('id')
+    categories = Category.objects.prefetch_related(
+        'translations', Prefetch('subcategory_set', queryset=subcategories)
+    ).order_by('id')
+    return [
+        {
+            'id': category.id,
+            'slugname': category.slugname,
+            'translations': {t.language_code: {'name': t.name} for t in category.translations.all()},
+            'sub_categories': [
+                {
+                    'id': subcategory.id,
+                    'slugname': subcategory.slugname,
+                    'translations': {t.language_code: {'name': t.name} for t in subcategory.translations.all()},
+                }
+                for subcategory in category.subcategory_set.all()
+            ],
+        }
+        for category in categories
+    ]
+
+
+def get_category_tree():
+    version = cache.get_or_set(CATEGORY_TREE_VERSION_KEY, time.time_ns, None)
+    key = f'category_tree:{version}'
+    entry = cache.get(key)
+    if entry is None:
+        tree = build_category_tree()
+        entry = {
+            'tree': tree,
+            'etag': hashlib.md5(json.dumps(tree, sort_keys=True).encode()).hexdigest(),
+            'last_modified': int(timezone.now().timestamp()),
+        }
+        cache.set(key, entry, CATEGORY_TREE_TIMEOUT)
+    return entry
+
+
+def invalidate_category_tree():
+    cache.set(CATEGORY_TREE_VERSION_KEY, time.time_ns(), None)
+
+
+RESPONSE_CACHE_PREFIX = 'response'
+RESPONSE_TAG_PREFIX = 'response_tag'
+
+
+def tag_versions(tags):
+    keys = [f'{RESPONSE_TAG_PREFIX}:{tag}' for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate_response_cache(*tags):
+    version = time.time_ns()
+    cache.set_many({f'{RESPONSE_TAG_PREFIX}:{tag}': version for tag in tags}, None)
+
+
+def product_cache_tags(product_id, category_id=None, subcategory_id=None):
+    # A product's own responses plus the list pages scoped to its category and
+    # subcategory; unscoped list pages are retired through the ids they contain.
+    tags = [f'product:{product_id}']
+    if category_id is not None:
+        tags.append(f'category:{category_id}:products')
+    if subcategory_id is not None:
+        tags.append(f'subcategory:{subcategory_id}:products')
+    return tags
+
+
+def product_list_cache_tags(params):
+    # 'products' is only bumped when products are added or removed.
+    tags = ['products']
+    for name in ('category', 'subcategory'):
+        if params.get(name):
+            tags.append(f'{name}:{params[name]}:products')
+    return tags
+
+
+def invalidate_response_cache_on_commit(*tags):
+    # Bump now, and again once committed so responses other requests cached
+    # from the old rows while the transaction was open are retired too.
+    invalidate_response_cache(*tags)
+    transaction.on_commit(lambda: invalidate_response_cache(*tags))
+
+
+class AnonymousResponseCacheMixin:
+    # Anonymous GETs are answered from the cache. The key covers the full URL,
+    # language and Accept header plus the current version of every tag, so
+    # invalidate_response_cache(tag) retires all entries built from it at once.
+    # With response_item_tag set, a list page also records the tags of the
+    # objects it contains and is rebuilt once any of them changes.
+    response_cache_tags = ()
+    response_item_tag = None
+    response_cache_actions = ('list', 'retrieve')
+    response_cache_timeout = 60 * 10
+    response_cache_max_age = 60
+
+    def get_response_cache_tags(self, request, *args, **kwargs):
+        return list(self.response_cache_tags)
+
+    def get_response_cache_timeout(self, request):
+        return self.response_cache_timeout
+
+    def get_response_item_tags(self, response):
+        # None when the page's objects can't be identified, so it isn't cached.
+        if self.response_item_tag is None:
+            return []
+        data = getattr(response, 'data', None)
+        results = data.get('results') if isinstance(data, dict) else data
+        if not isinstance(results, list):
+            return []
+        if not all(isinstance(item, dict) and 'id' in item for item in results):
+            return None
+        return [f'{self.response_item_tag}:{item["id"]}' for item in results]
+
+    def response_cacheable(self, request):
+        if request.method not in ('GET', 'HEAD') or 'HTTP_AUTHORIZATION' in request.META:
+            return False
+        action_map = getattr(self, 'action_map', None)
+        return action_map is None or action_map.get('get') in self.response_cache_actions
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.response_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        tags = self.get_response_cache_tags(request, *args, **kwargs)
+        fingerprint = json.dumps([request.build_absolute_uri(), get_language(), request.META.get('HTTP_ACCEPT', ''), tag_versions(tags)])
+        key = f'{RESPONSE_CACHE_PREFIX}:{hashlib.md5(fingerprint.encode()).hexdigest()}'
+        entry = cache.get(key)
+        if entry is not None and entry['item_tags'] and tag_versions(entry['item_tags']) != entry['item_versions']:
+            entry = None
+        if entry is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            item_tags = self.get_response_item_tags(response)
+            if item_tags is None:
+                return response
+            if hasattr(response, 'render'):
+                response.render()
+            entry = {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'etag': f'"{hashlib.md5(response.content).hexdigest()}"',
+                'item_tags': item_tags,
+                'item_versions': tag_versions(item_tags),
+            }
+            cache.set(key, entry, self.get_response_cache_timeout(request))
+        else:
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+
+        response['ETag'] = entry['etag']
+        patch_cache_control(response, public=True, max_age=self.response_cache_max_age)
+        patch_vary_headers(response, ['Authorization'])
+        return get_conditional_response(request, etag=entry['etag'], response=response)
+
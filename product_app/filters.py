@@ -0,0 +1,65 @@
+import django_filters
+from django.db.models import Case, CharField, Count, Value, When
+from .models import Category, Product, Subcategory
+
+PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000]
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class ProductFilter(django_filters.FilterSet):
+    minPrice = django_filters.NumberFilter(field_name='price_after_discount', lookup_expr='gte')
+    maxPrice = django_filters.NumberFilter(field_name='price_after_discount', lookup_expr='lte')
+    brand = CharInFilter(field_name='brand')
+    in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+    category = django_filters.ModelChoiceFilter(queryset=Category.objects.all())
+    subcategory = django_filters.ModelChoiceFilter(queryset=Subcategory.objects.all())
+
+    class Meta:
+        model = Product
+        fields = ['minPrice', 'maxPrice', 'brand', 'in_stock', 'category', 'subcategory']
+
+    def filter_in_stock(self, queryset, name, value):
+        return queryset.filter(stock__gt=0) if value else queryset.filter(stock=0)
+
+
+def price_bucket_labels():
+    bounds = list(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + [None]))
+    return [(f'{low}-{high}' if high is not None else f'{low}+', low, high) for low, high in bounds]
+
+
+def product_facets(queryset):
+    # One GROUP BY over (brand, price bucket, in stock); the per-facet counts
+    # are summed from its rows instead of running a query per facet.
+    labels = price_bucket_labels()
+    bucket = Case(
+        *[When(price_after_discount__lt=high, then=Value(label)) for label, low, high in labels if high is not None],
+        default=Value(labels[-1][0]),
+        output_field=CharField(),
+    )
+    rows = queryset.order_by().prefetch_related(None).annotate(
+        price_bucket=bucket,
+        available=Case(When(stock__gt=0, then=Value(True)), default=Value(False)),
+    ).values('brand', 'price_bucket', 'available').annotate(count=Count('id'))
+
+    brands, buckets, availability, total = {}, {}, {True: 0, False: 0}, 0
+    for row in rows:
+        brands[row['brand']] = brands.get(row['brand'], 0) + row['count']
+        buckets[row['price_bucket']] = buckets.get(row['price_bucket'], 0) + row['count']
+        availability[row['available']] += row['count']
+        total += row['count']
+
+    return {
+        'count': total,
+        'brands': sorted(
+            ({'brand': brand, 'count': count} for brand, count in brands.items()),
+            key=lambda facet: (-facet['count'], facet['brand'] or ''),
+        ),
+        'price_buckets': [
+            {'bucket': label, 'min': low, 'max': high, 'count': buckets.get(label, 0)}
+            for label, low, high in labels
+        ],
+        'in_stock': {'true': availability[True], 'false': availability[False]},
+    }
@@ -0,0 +1,82 @@
+import io
+import logging
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+from .storage import content_addressed_storage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELDS = ['image1', 'image2', 'image3', 'image4']
+VARIANT_WIDTHS = [200, 400, 800]
+VARIANT_DIR = 'products/variants'
+THUMBNAIL_SIZE = (300, 300)
+ENCODINGS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'avif': ('AVIF', {'quality': 60}),
+}
+
+
+def available_encodings():
+    # Pillow only registers a save handler for formats it was built with (AVIF needs
+    # Pillow 11.2+ or pillow-avif-plugin), so anything else is skipped.
+    Image.init()
+    return [name for name, (image_format, options) in ENCODINGS.items() if image_format in Image.SAVE]
+
+
+def store(content, extension):
+    # Content-hashed names make identical variants share one file and let them be cached forever.
+    return content_addressed_storage.save(f'{VARIANT_DIR}/variant.{extension}', ContentFile(content))
+
+
+def encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def open_image(field_file):
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    return image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+
+def build_variants(image):
+    widths = [width for width in VARIANT_WIDTHS if width < image.width] or [image.width]
+    encodings = available_encodings()
+    variants = {}
+    for width in widths:
+        resized = image if width == image.width else image.resize(
+            (width, max(1, round(image.height * width / image.width))), Image.Resampling.LANCZOS,
+        )
+        variants[str(width)] = {}
+        for name in encodings:
+            image_format, options = ENCODINGS[name]
+            variants[str(width)][name] = store(encode(resized, image_format, **options), name)
+    return variants
+
+
+def build_thumbnail(image):
+    thumbnail = ImageOps.fit(image.convert('RGB'), THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    return store(encode(thumbnail, 'JPEG', quality=85, optimize=True), 'jpg')
+
+
+def process_product_images(product):
+    # Returns (image_variants, thumbnail name). Variants remember the source they
+    # were built from so a replaced upload never serves stale variants.
+    image_variants = {}
+    thumbnail = None
+    for field in IMAGE_FIELDS:
+        field_file = getattr(product, field)
+        if not field_file:
+            continue
+        try:
+            image = open_image(field_file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error processing {field} of product {product.id}: {str(e)}")
+            continue
+        image_variants[field] = {'source': field_file.name, 'widths': build_variants(image)}
+        if thumbnail is None:
+            thumbnail = build_thumbnail(image)
+    return image_variants, thumbnail
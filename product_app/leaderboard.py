@@ -0,0 +1,192 @@
+import logging
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from redis.exceptions import RedisError
+from Azonix.redis_client import get_redis
+from .models import SalesBucket
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'top_sellers'
+HOURLY_RETENTION = timedelta(days=2)
+DAILY_RETENTION = timedelta(days=32)
+UNION_TIMEOUT = 60
+WINDOWS = {
+    '24h': ('h', 24),
+    '7d': ('d', 7),
+    '30d': ('d', 30),
+}
+
+
+def scope_key(category=None, subcategory=None):
+    if subcategory:
+        return f'{KEY_PREFIX}:subcategory:{subcategory}'
+    if category:
+        return f'{KEY_PREFIX}:category:{category}'
+    return f'{KEY_PREFIX}:all'
+
+
+def bucket_suffix(granularity, moment):
+    return moment.strftime('%Y%m%d%H' if granularity == 'h' else '%Y%m%d')
+
+
+def bucket_keys(scope, when):
+    # Yields (key, seconds left to keep it) for the hourly and daily buckets of `when`.
+    now = timezone.now()
+    hour_start = when.replace(minute=0, second=0, microsecond=0)
+    day_start = hour_start.replace(hour=0)
+    for granularity, start, retention in (('h', hour_start, HOURLY_RETENTION), ('d', day_start, DAILY_RETENTION)):
+        ttl = int((start + retention - now).total_seconds())
+        if ttl > 0:
+            yield f'{scope}:{granularity}:{bucket_suffix(granularity, start)}', ttl
+
+
+def record_order_sales(lines, when=None, sign=1):
+    # The database buckets are written with the order, Redis only once it commits.
+    when = when or timezone.now()
+    record_sales_buckets(lines, when, sign)
+    transaction.on_commit(lambda: record_sales(lines, when=when, sign=sign))
+
+
+def record_sales_buckets(lines, when, sign=1):
+    totals = {}
+    for product_id, _, _, quantity in lines:
+        totals[product_id] = totals.get(product_id, 0) + sign * quantity
+    if not totals:
+        return
+    hour_start = when.replace(minute=0, second=0, microsecond=0)
+    rows = [(product_id, SalesBucket.HOURLY, hour_start, quantity) for product_id, quantity in totals.items()]
+    upsert_sales_buckets(rows)
+
+
+def upsert_sales_buckets(rows):
+    table = SalesBucket._meta.db_table
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (product_id, granularity, bucket_start, quantity) VALUES {values} '
+            f'ON CONFLICT (product_id, granularity, bucket_start) '
+            f'DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity',
+            [value for row in rows for value in row],
+        )
+
+
+def compact_sales_buckets(now=None):
+    # Hourly buckets older than HOURLY_RETENTION are folded into one daily bucket
+    # per product in a single statement, so concurrent writes can't be lost.
+    now = now or timezone.now()
+    cutoff = (now - HOURLY_RETENTION).replace(hour=0, minute=0, second=0, microsecond=0)
+    table = SalesBucket._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH moved AS ('
+            f'DELETE FROM {table} WHERE granularity = %s AND bucket_start < %s '
+            f'RETURNING product_id, bucket_start, quantity) '
+            f'INSERT INTO {table} (product_id, granularity, bucket_start, quantity) '
+            f"SELECT product_id, %s, date_trunc('day', bucket_start), SUM(quantity) FROM moved "
+            f"GROUP BY product_id, date_trunc('day', bucket_start) "
+            f'ON CONFLICT (product_id, granularity, bucket_start) '
+            f'DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity',
+            [SalesBucket.HOURLY, cutoff, SalesBucket.DAILY],
+        )
+        return cursor.rowcount
+
+
+def window_buckets(window, now=None):
+    granularity, span = WINDOWS[window]
+    since = (now or timezone.now()) - (timedelta(hours=span) if granularity == 'h' else timedelta(days=span))
+    day_start = since.replace(hour=0, minute=0, second=0, microsecond=0)
+    return SalesBucket.objects.filter(
+        Q(granularity=SalesBucket.HOURLY, bucket_start__gte=since)
+        | Q(granularity=SalesBucket.DAILY, bucket_start__gte=day_start)
+    )
+
+
+def bucket_top_sellers(limit=10, window='24h', category=None, subcategory=None):
+    buckets = window_buckets(window)
+    if subcategory:
+        buckets = buckets.filter(product__subcategory_id=subcategory)
+    elif category:
+        buckets = buckets.filter(product__category_id=category)
+    ranking = buckets.values('product_id').annotate(total=Sum('quantity')).filter(total__gt=0).order_by('-total', 'product_id')
+    return [(row['product_id'], row['total']) for row in ranking[:limit]]
+
+
+def record_sales(lines, when=None, sign=1):
+    # lines: iterable of (product_id, category_id, subcategory_id, quantity). The
+    # leaderboard can be rebuilt from the database, so Redis errors are only logged.
+    try:
+        _record_sales(lines, when or timezone.now(), sign)
+    except RedisError as e:
+        logger.error(f"Error recording sales in the top seller leaderboard: {str(e)}")
+
+
+def _record_sales(lines, when, sign):
+    pipeline = get_redis().pipeline(transaction=False)
+    for product_id, category_id, subcategory_id, quantity in lines:
+        scopes = [scope_key(), scope_key(category=category_id)]
+        if subcategory_id:
+            scopes.append(scope_key(subcategory=subcategory_id))
+        for scope in scopes:
+            pipeline.zincrby(scope, sign * quantity, product_id)
+            for key, ttl in bucket_keys(scope, when):
+                pipeline.zincrby(key, sign * quantity, product_id)
+                pipeline.expire(key, ttl)
+            if sign < 0:
+                pipeline.zremrangebyscore(scope, '-inf', 0)
+    pipeline.execute()
+
+
+def top_sellers(limit=10, window=None, category=None, subcategory=None):
+    client = get_redis()
+    scope = scope_key(category, subcategory)
+    key = scope
+    if window:
+        granularity, span = WINDOWS[window]
+        now = timezone.now()
+        step = timedelta(hours=1) if granularity == 'h' else timedelta(days=1)
+        key = f'{scope}:{window}:{bucket_suffix("h", now)}'
+        if not client.exists(key):
+            buckets = [f'{scope}:{granularity}:{bucket_suffix(granularity, now - step * i)}' for i in range(span)]
+            pipeline = client.pipeline()
+            pipeline.zunionstore(key, buckets)
+            pipeline.expire(key, UNION_TIMEOUT)
+            pipeline.execute()
+    elif not client.exists(key):
+        return None
+    ranking = client.zrevrangebyscore(key, '+inf', '(0', start=0, num=limit, withscores=True)
+    return [(int(product_id), int(score)) for product_id, score in ranking]
+
+
+def rebuild_leaderboard():
+    from .models import Product
+
+    client = get_redis()
+    stale = list(client.scan_iter(f'{KEY_PREFIX}:*'))
+    if stale:
+        client.delete(*stale)
+
+    lifetime = Product.objects.filter(sales_count__gt=0).values_list('id', 'category_id', 'subcategory_id', 'sales_count')
+    pipeline = client.pipeline(transaction=False)
+    for product_id, category_id, subcategory_id, sales_count in lifetime.iterator():
+        for scope in filter(None, [scope_key(), scope_key(category=category_id),
+                                   subcategory_id and scope_key(subcategory=subcategory_id)]):
+            pipeline.zadd(scope, {product_id: sales_count})
+    pipeline.execute()
+
+    recent = SalesBucket.objects.filter(
+        bucket_start__gte=timezone.now() - DAILY_RETENTION,
+    ).values_list('granularity', 'bucket_start', 'product_id', 'product__category_id', 'product__subcategory_id', 'quantity')
+    pipeline = client.pipeline(transaction=False)
+    for granularity, bucket_start, product_id, category_id, subcategory_id, quantity in recent.iterator():
+        for scope in filter(None, [scope_key(), scope_key(category=category_id),
+                                   subcategory_id and scope_key(subcategory=subcategory_id)]):
+            for key, ttl in bucket_keys(scope, bucket_start):
+                # A daily bucket only covers its day, not any single hour of it.
+                if granularity == SalesBucket.DAILY and ':h:' in key:
+                    continue
+                pipeline.zincrby(key, quantity, product_id)
+                pipeline.expire(key, ttl)
+    pipeline.execute()
@@ -0,0 +1,21 @@
+import sys
+from django.core.management.base import BaseCommand
+from Azonix.streaming import serialize_lines
+from product_app.bulk import EXPORT_FIELDS, export_rows
+
+
+class Command(BaseCommand):
+    help = 'Export products and their en/fa translations as CSV or JSONL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', dest='file_format')
+        parser.add_argument('--output', help='File to write to, defaults to stdout.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        lines = serialize_lines(options['file_format'], EXPORT_FIELDS, export_rows(chunk_size=options['chunk_size']))
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from product_app.images import IMAGE_FIELDS, VARIANT_DIR
+from product_app.models import Product
+from product_app.storage import content_addressed_storage
+
+IMAGE_DIRS = ['products/images', 'products/thumbnails', VARIANT_DIR]
+
+
+class Command(BaseCommand):
+    help = 'Delete stored product images and variants that no product references any more.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Only delete files older than this many hours, so in-flight uploads are kept.')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        referenced = self.referenced_names()
+        cutoff = timezone.now() - timedelta(hours=options['min_age'])
+        storage = content_addressed_storage
+        deleted = 0
+        for directory in IMAGE_DIRS:
+            if not storage.exists(directory):
+                continue
+            for filename in storage.listdir(directory)[1]:
+                name = f'{directory}/{filename}'
+                if name in referenced or storage.get_modified_time(name) > cutoff:
+                    continue
+                # The snapshot may be stale: an upload can have reused this blob since.
+                if self.is_referenced(name) or storage.get_modified_time(name) > cutoff:
+                    continue
+                if not options['dry_run']:
+                    storage.delete(name)
+                deleted += 1
+                self.stdout.write(name)
+        action = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{action} {deleted} unreferenced files.'))
+
+    def referenced_names(self):
+        referenced = set()
+        rows = Product.objects.values_list(*IMAGE_FIELDS, 'thumbnail', 'image_variants')
+        for *names, image_variants in rows.iterator(chunk_size=2000):
+            referenced.update(name for name in names if name)
+            for variants in image_variants.values():
+                for encodings in variants['widths'].values():
+                    referenced.update(encodings.values())
+        return referenced
+
+    def is_referenced(self, name):
+        condition = Q(thumbnail=name)
+        for field in IMAGE_FIELDS:
+            condition |= Q(**{field: name})
+        products = Product.objects.annotate(variants_text=Cast('image_variants', TextField()))
+        return products.filter(condition | Q(variants_text__contains=f'"{name}"')).exists()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from product_app.bulk import file_format_for, import_products
+
+
+class Command(BaseCommand):
+    help = 'Import products and their en/fa translations from a CSV or JSONL file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], dest='file_format')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or file_format_for(options['path'])
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+                report = import_products(stream, file_format, chunk_size=options['chunk_size'])
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(f"Could not read {options['path']}: {str(e)}")
+
+        for error in report['errors']:
+            self.stderr.write(f"Row {error['row']}: {dict(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['created']} products, {len(report['errors'])} rows rejected."
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from product_app.leaderboard import rebuild_leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Redis top seller leaderboard from products and recent orders.'
+
+    def handle(self, *args, **options):
+        rebuild_leaderboard()
+        self.stdout.write(self.style.SUCCESS('Top seller leaderboard rebuilt.'))
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('product_app', 'Product')
+    Rating = apps.get_model('product_app', 'Rating')
+
+    histograms = {}
+    for row in Rating.objects.values('product_id', 'rating').annotate(total=Count('id')):
+        histograms.setdefault(row['product_id'], {})[row['rating']] = row['total']
+
+    products = []
+    for product in Product.objects.filter(id__in=histograms):
+        histogram = histograms[product.id]
+        for star in range(1, 6):
+            setattr(product, f'rating_{star}_count', histogram.get(star, 0))
+        product.rating_count = sum(histogram.values())
+        product.rating_avg = sum(star * count for star, count in histogram.items()) / product.rating_count
+        products.append(product)
+
+    fields = ['rating_avg', 'rating_count'] + [f'rating_{star}_count' for star in range(1, 6)]
+    Product.objects.bulk_update(products, fields, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_app', '0006_product_price_after_discount_in_rials'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
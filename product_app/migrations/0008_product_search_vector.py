@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_app', '0007_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE product_app_product AS product
+            SET search_vector = (
+                SELECT setweight(to_tsvector('simple', COALESCE(string_agg(t.name, ' '), '')), 'A')
+                    || setweight(to_tsvector('simple', COALESCE(string_agg(t.description, ' '), '')), 'B')
+                FROM product_app_product_translation AS t
+                WHERE t.master_id = product.id
+            )
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_app', '0008_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price_after_discount', 'id'], name='product_price_id_idx'),
+        ),
+    ]
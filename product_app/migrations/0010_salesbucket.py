@@ -0,0 +1,53 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:26
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+
+def backfill_sales_buckets(apps, schema_editor):
+    OrderItem = apps.get_model('order_app', 'OrderItem')
+    SalesBucket = apps.get_model('product_app', 'SalesBucket')
+    cutoff = (timezone.now() - timedelta(days=2)).replace(hour=0, minute=0, second=0, microsecond=0)
+    items = OrderItem.objects.exclude(order__delivery_status='cancelled')
+    for granularity, trunc, window in (
+        ('day', TruncDay, {'order__order_date__lt': cutoff}),
+        ('hour', TruncHour, {'order__order_date__gte': cutoff}),
+    ):
+        rows = items.filter(**window).annotate(bucket_start=trunc('order__order_date')).values(
+            'product_id', 'bucket_start',
+        ).annotate(total=Sum('quantity'))
+        SalesBucket.objects.bulk_create(
+            (SalesBucket(product_id=row['product_id'], granularity=granularity,
+                         bucket_start=row['bucket_start'], quantity=row['total']) for row in rows.iterator()),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_app', '0009_product_product_price_id_idx'),
+        ('order_app', '0010_wishlistitem_notified_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_buckets', to='product_app.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'bucket_start'], name='sales_bucket_window_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'granularity', 'bucket_start'), name='unique_sales_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_sales_buckets, migrations.RunPython.noop),
+    ]
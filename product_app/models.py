@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.fields.files import FieldFile
 from user_app.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from parler.models import TranslatableModel, TranslatedFields
@@ -7,6 +10,55 @@ from asgiref.sync import async_to_sync
 from django.dispatch import receiver
 from django.apps import apps
 from parler.utils.context import switch_language
+from .storage import product_image_storage
+
+class DirtyFieldsMixin:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            attname: value.name if isinstance(value, FieldFile) else value
+            for attname, value in zip(field_names, values)
+        }
+        return instance
+
+    def _current_value(self, field):
+        value = getattr(self, field.attname)
+        return value.name if isinstance(value, FieldFile) else value
+
+    def _snapshot_values(self, fields=None):
+        loaded_values = getattr(self, '_loaded_values', {}) if fields is not None else {}
+        for field in self._meta.concrete_fields:
+            if field.attname not in self.__dict__:
+                continue
+            if fields is None or field.name in fields or field.attname in fields:
+                loaded_values[field.attname] = self._current_value(field)
+        self._loaded_values = loaded_values
+
+    def has_snapshot(self):
+        return hasattr(self, '_loaded_values')
+
+    def previous_value(self, field_name):
+        field = self._meta.get_field(field_name)
+        return getattr(self, '_loaded_values', {}).get(field.attname)
+
+    def get_dirty_fields(self):
+        loaded_values = getattr(self, '_loaded_values', None)
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            if loaded_values is None:
+                dirty[field.name] = None
+            elif field.attname in loaded_values and self._current_value(field) != loaded_values[field.attname]:
+                dirty[field.name] = loaded_values[field.attname]
+        return dirty
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_values(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._snapshot_values(kwargs.get('fields'))
 
 class Category(TranslatableModel):
     translations = TranslatedFields(
@@ -37,7 +89,7 @@ class Rating(models.Model):
     def __str__(self):
         return f'{self.rating} by {self.user}'
 
-class Product(TranslatableModel):
+class Product(DirtyFieldsMixin, TranslatableModel):
     translations = TranslatedFields(
         name=models.CharField(max_length=255, null=False, blank=False, unique=True),
         description=models.TextField(max_length=2000, null=True, blank=True),
@@ -56,15 +108,33 @@ class Product(TranslatableModel):
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     subcategory = models.ForeignKey(Subcategory, on_delete=models.CASCADE, blank=True, null=True)
 
-    image1 = models.ImageField(upload_to='products/images/', blank=True, null=True)
-    image2 = models.ImageField(upload_to='products/images/', blank=True, null=True)
-    image3 = models.ImageField(upload_to='products/images/', blank=True, null=True)
-    image4 = models.ImageField(upload_to='products/images/', blank=True, null=True)
+    image1 = models.ImageField(upload_to='products/images/', storage=product_image_storage, blank=True, null=True)
+    image2 = models.ImageField(upload_to='products/images/', storage=product_image_storage, blank=True, null=True)
+    image3 = models.ImageField(upload_to='products/images/', storage=product_image_storage, blank=True, null=True)
+    image4 = models.ImageField(upload_to='products/images/', storage=product_image_storage, blank=True, null=True)
 
-    thumbnail = models.ImageField(upload_to='products/thumbnails/', blank=True)
+    thumbnail = models.ImageField(upload_to='products/thumbnails/', storage=product_image_storage, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     sales_count = models.IntegerField(default=0)
+    rating_avg = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            models.Index(fields=['price_after_discount', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['category', 'price_after_discount', 'id'], name='product_category_price_idx'),
+            models.Index(fields=['subcategory', 'price_after_discount', 'id'], name='product_subcat_price_idx'),
+            models.Index(fields=['brand', 'price_after_discount'], name='product_brand_price_idx'),
+        ]
     
     def __str__(self):
         try:
@@ -74,6 +144,26 @@ class Product(TranslatableModel):
             return f"Product ID: {self.id} (No translation available)"
     
 
+class SalesBucket(models.Model):
+    HOURLY = 'hour'
+    DAILY = 'day'
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_buckets')
+    granularity = models.CharField(max_length=4, choices=[(HOURLY, 'Hourly'), (DAILY, 'Daily')])
+    bucket_start = models.DateTimeField()
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'granularity', 'bucket_start'], name='unique_sales_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket_start'], name='sales_bucket_window_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} of product {self.product_id} ({self.granularity} from {self.bucket_start})'
+
+
 class Comment(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='comments',null=False,blank=False)
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
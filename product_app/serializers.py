@@ -1,8 +1,11 @@
 from rest_framework import serializers
 from django.utils.text import slugify
 from .models import *
+from .images import IMAGE_FIELDS
+from .storage import content_addressed_storage
 from django.core.files.storage import default_storage
 from parler_rest.serializers import TranslatableModelSerializer, TranslatedFieldsField
+from Azonix.serializers import SparseFieldsetMixin
 
 class SubcategorySerializer(TranslatableModelSerializer):
     translations = TranslatedFieldsField(shared_model=Subcategory)
@@ -27,7 +30,50 @@ class CategorySerializer(TranslatableModelSerializer):
         fields = ['id', 'translations', 'slugname', 'sub_categories']
 
 
-class ProductSerializer(TranslatableModelSerializer):
+def image_variant_urls(obj, field, request):
+    image = getattr(obj, field)
+    variants = obj.image_variants.get(field)
+    if not image or not variants or variants['source'] != image.name:
+        return None
+    urls = {}
+    for width, encodings in variants['widths'].items():
+        urls[width] = {}
+        for encoding, name in encodings.items():
+            url = content_addressed_storage.url(name)
+            urls[width][encoding] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+class WishlistFlagMixin:
+    # The view puts the ids the user has wishlisted in the context when asked to.
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        wishlisted = self.context.get('wishlisted')
+        if wishlisted is not None:
+            data['in_wishlist'] = instance.id in wishlisted
+        return data
+
+
+class ProductListSerializer(WishlistFlagMixin, SparseFieldsetMixin, serializers.ModelSerializer):
+    name = serializers.SerializerMethodField()
+    in_stock = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ['id', 'slugname', 'name', 'thumbnail', 'image_variants', 'price_after_discount', 'in_stock', 'rating_avg', 'rating_count']
+
+    def get_name(self, obj):
+        return obj.safe_translation_getter('name', any_language=True)
+
+    def get_in_stock(self, obj):
+        return obj.stock > 0
+
+    def get_image_variants(self, obj):
+        return image_variant_urls(obj, 'image1', self.context.get('request'))
+
+
+class ProductSerializer(WishlistFlagMixin, SparseFieldsetMixin, TranslatableModelSerializer):
     translations_en_name = serializers.CharField(write_only=True, required=False, allow_blank=True)
     translations_en_description = serializers.CharField(write_only=True, required=False, allow_blank=True)
     translations_fa_name = serializers.CharField(write_only=True, required=False, allow_blank=True)
@@ -53,12 +99,15 @@ class ProductSerializer(TranslatableModelSerializer):
     subcategory_name_en = serializers.SerializerMethodField(read_only=True)
     subcategory_name_fa = serializers.SerializerMethodField(read_only=True)
     subcategory_slug = serializers.SerializerMethodField(read_only=True)
+    rating_histogram = serializers.SerializerMethodField(read_only=True)
+    image_variants = serializers.SerializerMethodField(read_only=True)
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False)
 
     class Meta:
         model = Product
         fields = '__all__'
-        read_only_fields = ["id", "created_at", "updated_at"]
+        read_only_fields = ["id", "created_at", "updated_at", "rating_avg", "rating_count",
+                            "rating_1_count", "rating_2_count", "rating_3_count", "rating_4_count", "rating_5_count"]
 
     def get_translations(self, obj):
         return {
@@ -90,6 +139,18 @@ class ProductSerializer(TranslatableModelSerializer):
     def get_subcategory_slug(self, obj):
         return obj.subcategory.slugname if obj.subcategory else None
 
+    def get_rating_histogram(self, obj):
+        return {star: getattr(obj, f'rating_{star}_count') for star in range(1, 6)}
+
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        variants = {}
+        for field in IMAGE_FIELDS:
+            urls = image_variant_urls(obj, field, request)
+            if urls:
+                variants[field] = urls
+        return variants
+
     def create(self, validated_data):
         translations_en_name = validated_data.pop('translations_en_name', None)
         translations_en_description = validated_data.pop('translations_en_description', None)
@@ -186,6 +247,36 @@ class ProductSerializer(TranslatableModelSerializer):
         instance.save()
         return instance
  
+
+class ProductImportSerializer(serializers.Serializer):
+    slugname = serializers.SlugField(max_length=255, required=False)
+    name_en = serializers.CharField(max_length=255)
+    description_en = serializers.CharField(max_length=2000, required=False)
+    name_fa = serializers.CharField(max_length=255, required=False)
+    description_fa = serializers.CharField(max_length=2000, required=False)
+    brand = serializers.CharField(max_length=50, default='No Brand')
+    price = serializers.FloatField(min_value=0)
+    discount_percentage = serializers.IntegerField(min_value=0, max_value=100, default=0)
+    stock = serializers.IntegerField(min_value=0, default=0)
+    category = serializers.CharField()
+    subcategory = serializers.CharField(required=False)
+
+    def validate_category(self, value):
+        category_id = self.context['categories'].get(value)
+        if category_id is None:
+            raise serializers.ValidationError(f"Unknown category '{value}'.")
+        return category_id
+
+    def validate(self, data):
+        if 'subcategory' in data:
+            subcategory = self.context['subcategories'].get(data['subcategory'])
+            if subcategory is None:
+                raise serializers.ValidationError({'subcategory': f"Unknown subcategory '{data['subcategory']}'."})
+            if subcategory[1] != data['category']:
+                raise serializers.ValidationError({'subcategory': 'Subcategory does not belong to the category.'})
+            data['subcategory'] = subcategory[0]
+        return data
+
     
 class ProductDetailSerializer(TranslatableModelSerializer):
     translations = TranslatedFieldsField(shared_model=Product)
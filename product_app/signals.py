@@ -1,8 +1,12 @@
 import logging
-from django.db.models.signals import pre_save, post_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import Product
-from .utils import notify_users
+from .caching import invalidate_category_tree, invalidate_response_cache_on_commit, product_cache_tags
+from .models import Category, Product, Rating, Subcategory
+from .images import IMAGE_FIELDS
+from .tasks import generate_image_variants, notify_back_in_stock
+from .utils import RIAL_RATE, update_rating_aggregates, update_search_vectors
 
 logger = logging.getLogger(__name__)
 
@@ -19,20 +23,18 @@ def calculate_price_after_discount(sender, instance, **kwargs):
 @receiver(pre_save, sender=Product)
 def calculate_price_in_rials(sender, instance, **kwargs):
     if instance.price:
-        instance.price_in_rials = instance.price * 600000
+        instance.price_in_rials = instance.price * RIAL_RATE
         logger.info(f"Calculated price in rials for product {instance.id}: {instance.price_in_rials}")
     if instance.price_after_discount:
-        instance.price_after_discount_in_rials = instance.price_after_discount * 600000
+        instance.price_after_discount_in_rials = instance.price_after_discount * RIAL_RATE
         logger.info(f"Calculated price after discount in rials for product {instance.id}: {instance.price_after_discount_in_rials}")
 
 @receiver(pre_save, sender=Product)
 def product_stock_update(sender, instance, **kwargs):
-    if instance.pk:
-        try:
-            old_product = Product.objects.get(pk=instance.pk)
-            instance._old_stock = old_product.stock  
-        except Product.DoesNotExist:
-            instance._old_stock = None
+    if instance.has_snapshot():
+        instance._old_stock = instance.previous_value('stock')
+    elif instance.pk:
+        instance._old_stock = Product.objects.filter(pk=instance.pk).values_list('stock', flat=True).first()
     else:
         instance._old_stock = None
 
@@ -44,8 +46,85 @@ def notify_stock_update(sender, instance, **kwargs):
         logger.info(f"New stock for product {instance.id}: {instance.stock}")
         if instance._old_stock == 0 and instance.stock > 0:
             logger.info(f"Stock updated from 0 to {instance.stock} for product {instance.id}, notifying users")
-            notify_users(instance)
+            product_id, restocked_at = instance.id, instance.updated_at.isoformat()
+            transaction.on_commit(lambda: notify_back_in_stock.delay(product_id, restocked_at))
         else:
             logger.info(f"No stock change from 0 to positive for product {instance.id}")
     else:
-        logger.info(f"New product {instance.id} created with stock {instance.stock}")
\ No newline at end of file
+        logger.info(f"New product {instance.id} created with stock {instance.stock}")
+
+@receiver(post_save, sender=Product)
+def queue_image_variants(sender, instance, created, **kwargs):
+    dirty = instance.get_dirty_fields()
+    if not any(field in dirty for field in IMAGE_FIELDS):
+        return
+    if any(getattr(instance, field) for field in IMAGE_FIELDS) or instance.image_variants:
+        product_id = instance.id
+        transaction.on_commit(lambda: generate_image_variants.delay(product_id))
+
+def invalidate_product_responses(product_id):
+    scope = Product.objects.filter(pk=product_id).values_list('category_id', 'subcategory_id').first() or ()
+    invalidate_response_cache_on_commit(*product_cache_tags(product_id, *scope))
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    tags = product_cache_tags(instance.id, instance.category_id, instance.subcategory_id)
+    # A product moved to another category leaves that category's lists too.
+    tags += product_cache_tags(instance.id, instance.previous_value('category'), instance.previous_value('subcategory'))
+    if created:
+        tags.append('products')
+    invalidate_response_cache_on_commit(*tags)
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    invalidate_response_cache_on_commit('products', *product_cache_tags(instance.id, instance.category_id, instance.subcategory_id))
+
+@receiver(post_save, sender=Product._parler_meta.root_model)
+@receiver(post_delete, sender=Product._parler_meta.root_model)
+def product_translation_changed(sender, instance, **kwargs):
+    invalidate_product_responses(instance.master_id)
+
+@receiver(post_save, sender=Product._parler_meta.root_model)
+@receiver(post_delete, sender=Product._parler_meta.root_model)
+def translation_search_vector_update(sender, instance, **kwargs):
+    update_search_vectors(Product.objects.filter(pk=instance.master_id))
+
+@receiver(pre_save, sender=Rating)
+def rating_previous_value(sender, instance, **kwargs):
+    instance._old_rating = None
+    if instance.pk:
+        instance._old_rating = Rating.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, created, **kwargs):
+    old_rating = None if created else instance._old_rating
+    if old_rating is None:
+        update_rating_aggregates(instance.product_id, added=instance.rating)
+    elif old_rating[0] != instance.product_id:
+        update_rating_aggregates(old_rating[0], removed=old_rating[1])
+        update_rating_aggregates(instance.product_id, added=instance.rating)
+    else:
+        update_rating_aggregates(instance.product_id, added=instance.rating, removed=old_rating[1])
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    update_rating_aggregates(instance.product_id, removed=instance.rating)
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def rating_changed(sender, instance, **kwargs):
+    invalidate_product_responses(instance.product_id)
+    if getattr(instance, '_old_rating', None) and instance._old_rating[0] != instance.product_id:
+        invalidate_product_responses(instance._old_rating[0])
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Category._parler_meta.root_model)
+@receiver(post_delete, sender=Category._parler_meta.root_model)
+@receiver(post_save, sender=Subcategory)
+@receiver(post_delete, sender=Subcategory)
+@receiver(post_save, sender=Subcategory._parler_meta.root_model)
+@receiver(post_delete, sender=Subcategory._parler_meta.root_model)
+def category_tree_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_category_tree)
+    invalidate_response_cache_on_commit('categories')
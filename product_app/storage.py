@@ -0,0 +1,38 @@
+import hashlib
+import os
+import posixpath
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    # Files are named after a hash of their bytes, so uploading the same image
+    # again reuses the stored copy instead of writing a new random-suffix file.
+    hash_length = 32
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        directory, basename = posixpath.split(name)
+        extension = posixpath.splitext(basename)[1].lower()
+        name = posixpath.join(directory, f'{digest.hexdigest()[:self.hash_length]}{extension}')
+        if self.exists(name):
+            # Refresh the mtime so garbage collection sees the reused blob as new.
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                pass
+        return super().save(name, content, max_length)
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def product_image_storage():
+    return content_addressed_storage
@@ -0,0 +1,52 @@
+import logging
+from celery import shared_task
+from django.utils.dateparse import parse_datetime
+from . import leaderboard
+from .caching import invalidate_response_cache
+from .images import VARIANT_DIR, process_product_images
+from .models import Product
+from .utils import notify_users
+
+logger = logging.getLogger(__name__)
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def notify_back_in_stock(self, product_id, restocked_at):
+    product = Product.objects.filter(pk=product_id).first()
+    if product is None:
+        logger.info(f"Product {product_id} no longer exists, skipping availability emails")
+        return 0
+    try:
+        return notify_users(product, parse_datetime(restocked_at))
+    except Exception as exc:
+        logger.error(f"Error notifying users about product {product_id}: {str(exc)}")
+        raise self.retry(exc=exc)
+
+
+@shared_task
+def compact_sales_buckets():
+    compacted = leaderboard.compact_sales_buckets()
+    logger.info(f"Compacted {compacted} daily sales buckets")
+    return compacted
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def generate_image_variants(self, product_id):
+    product = Product.objects.filter(pk=product_id).first()
+    if product is None:
+        logger.info(f"Product {product_id} no longer exists, skipping image variants")
+        return
+    try:
+        image_variants, thumbnail = process_product_images(product)
+    except Exception as exc:
+        logger.error(f"Error generating image variants for product {product_id}: {str(exc)}")
+        raise self.retry(exc=exc)
+
+    changes = {'image_variants': image_variants}
+    # Only replace thumbnails we generated ourselves, never an uploaded one.
+    if thumbnail and (not product.thumbnail or product.thumbnail.name.startswith(VARIANT_DIR)):
+        changes['thumbnail'] = thumbnail
+    Product.objects.filter(pk=product_id).update(**changes)
+    # update() fires no signals, so retire cached responses showing the old images here.
+    invalidate_response_cache(f'product:{product_id}')
+    logger.info(f"Generated image variants for product {product_id}")
+
@@ -1,7 +1,31 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from Azonix.redis_client import get_redis
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import Category, Subcategory, Product, Comment, Rating
+from redis.exceptions import RedisError
+from .models import Category, Subcategory, Product, Comment, Rating, SalesBucket
+from .leaderboard import bucket_top_sellers, compact_sales_buckets, record_sales, record_sales_buckets, rebuild_leaderboard
+from .images import ENCODINGS, available_encodings, encode
+from .tasks import generate_image_variants
+from .utils import notify_users
+from order_app.models import Wishlist, WishlistItem
 from user_app.models import User
 
 class CategoryTests(APITestCase):
@@ -241,4 +265,829 @@ class TopSellerTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 2)
         self.assertEqual(response.data['results'][0]['slugname'], 'iphone')
-        self.assertEqual(response.data['results'][1]['slugname'], 'samsung')
\ No newline at end of file
+        self.assertEqual(response.data['results'][1]['slugname'], 'samsung')
+        self.assertNotIn('translations', response.data['results'][0])
+
+    def test_query_count_does_not_grow_with_results(self):
+        url = reverse('top-seller')
+        cache.clear()
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url, {'limit': 1})
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+
+def create_translated(model, names, **fields):
+    obj = model(**fields)
+    for lang, name in names.items():
+        obj.set_current_language(lang)
+        obj.name = name
+    obj.save()
+    return obj
+
+
+class ProductListQueryTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='adminpassword', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.category = create_translated(Category, {'en': 'Electronics', 'fa': 'الکترونیک'}, slugname='electronics')
+        self.subcategory = create_translated(Subcategory, {'en': 'Phones', 'fa': 'تلفن'}, slugname='phones', category=self.category)
+        for i in range(10):
+            create_translated(Product, {'en': f'Phone {i}', 'fa': f'تلفن {i}'}, slugname=f'phone-{i}', price=100 + i,
+                              stock=5, category=self.category, subcategory=self.subcategory)
+
+    def count_list_queries(self, page_size):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('product-list'), {'page_size': page_size})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), page_size)
+        return len(context.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        self.assertEqual(self.count_list_queries(2), self.count_list_queries(10))
+
+    def test_list_uses_compact_representation(self):
+        response = self.client.get(reverse('product-list'), {'page_size': 1})
+        product = response.data['results'][0]
+        self.assertEqual(set(product), {'id', 'slugname', 'name', 'thumbnail', 'image_variants', 'price_after_discount', 'in_stock', 'rating_avg', 'rating_count'})
+        self.assertEqual((product['name'], product['in_stock']), ('Phone 0', True))
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get(reverse('product-list'), {'page_size': 1, 'fields': 'id,slugname'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'slugname'})
+        product = Product.objects.get(slugname='phone-0')
+        response = self.client.get(reverse('product-detail', args=[product.id]), {'fields': 'slugname,translations,category_name_en'})
+        self.assertEqual(set(response.data), {'slugname', 'translations', 'category_name_en'})
+
+    def test_retrieve_includes_category_translations(self):
+        product = Product.objects.get(slugname='phone-0')
+        response = self.client.get(reverse('product-detail', args=[product.id]))
+        self.assertEqual(response.data['category_name_en'], 'Electronics')
+        self.assertEqual(response.data['subcategory_name_fa'], 'تلفن')
+        self.assertEqual(response.data['translations']['fa']['name'], 'تلفن 0')
+
+
+class RatingAggregateTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='adminpassword', is_staff=True)
+        self.other = User.objects.create_user(username='other', password='otherpassword')
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        self.product = create_translated(Product, {'en': 'iPhone'}, slugname='iphone', price=100, category=self.category)
+        self.other_product = create_translated(Product, {'en': 'Galaxy'}, slugname='galaxy', price=80, category=self.category)
+
+    def test_aggregates_follow_rating_changes(self):
+        rating = Rating.objects.create(rating=5, product=self.product, user=self.admin)
+        Rating.objects.create(rating=2, product=self.product, user=self.other)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.rating_avg, 3.5)
+        self.assertEqual(self.product.rating_5_count, 1)
+
+        rating.rating = 4
+        rating.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_5_count, 0)
+        self.assertEqual(self.product.rating_4_count, 1)
+        self.assertEqual(self.product.rating_avg, 3.0)
+
+        rating.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 1)
+        self.assertEqual(self.product.rating_avg, 2.0)
+
+    def test_list_orders_by_rating(self):
+        Rating.objects.create(rating=1, product=self.product, user=self.admin)
+        Rating.objects.create(rating=5, product=self.other_product, user=self.admin)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('product-list'), {'ordering': '-rating_avg'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['slugname'] for p in response.data['results']], ['galaxy', 'iphone'])
+        self.assertEqual(response.data['results'][0]['rating_avg'], 5)
+
+
+class ProductSearchTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='adminpassword', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        self.phone = create_translated(Product, {'en': 'Galaxy Phone', 'fa': 'گوشی گلکسی'}, slugname='galaxy-phone',
+                                       price=100, category=self.category)
+        self.case = create_translated(Product, {'en': 'Leather Case'}, slugname='leather-case', price=10, category=self.category)
+        self.case.set_current_language('en')
+        self.case.description = 'Fits the Galaxy phone'
+        self.case.save()
+
+    def search(self, query):
+        response = self.client.get(reverse('product-list'), {'search': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['slugname'] for product in response.data['results']]
+
+    def test_search_matches_both_languages_without_duplicates(self):
+        self.assertEqual(self.search('galaxy phone'), ['galaxy-phone', 'leather-case'])
+        self.assertEqual(self.search('گلکسی'), ['galaxy-phone'])
+
+    def test_search_matches_prefixes(self):
+        self.assertEqual(self.search('leath'), ['leather-case'])
+
+    def test_search_vector_follows_translation_updates(self):
+        self.phone.set_current_language('fa')
+        self.phone.name = 'موبایل'
+        self.phone.save()
+        self.assertEqual(self.search('گلکسی'), [])
+        self.assertEqual(self.search('موبایل'), ['galaxy-phone'])
+
+
+class ProductKeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='adminpassword', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        for i, price in enumerate([50, 10, 30, 30, 20, 40, 30]):
+            create_translated(Product, {'en': f'Product {i}'}, slugname=f'product-{i}', price=price, category=self.category)
+
+    def test_cursor_pages_cover_listing_without_count(self):
+        url = reverse('product-list') + '?pagination=cursor&page_size=3'
+        pages = []
+        with CaptureQueriesContext(connection) as context:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertIsNone(response.data['count'])
+                pages.append(response.data)
+                url = response.data['next']
+        self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+
+        results = [product for page in pages for product in page['results']]
+        expected = list(Product.objects.order_by('price_after_discount', 'id').values_list('slugname', flat=True))
+        self.assertEqual([product['slugname'] for product in results], expected)
+        self.assertIsNone(pages[0]['previous'])
+
+        response = self.client.get(pages[2]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('product-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def walk(self, params):
+        url = reverse('product-list') + f'?pagination=cursor&page_size=2&{params}'
+        slugs = []
+        while url:
+            self.assertLess(len(slugs), 20)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.json()
+            slugs += [product['slugname'] for product in data['results']]
+            url = data['next']
+        return slugs
+
+    def test_cursor_follows_requested_sort(self):
+        for i, product in enumerate(Product.objects.order_by('id')):
+            Product.objects.filter(id=product.id).update(sales_count=i % 3, rating_avg=(i * 7) % 5)
+        expected = list(Product.objects.order_by('-sales_count', '-id').values_list('slugname', flat=True))
+        self.assertEqual(self.walk('sort=sales_count&sort_order=desc'), expected)
+        expected = list(Product.objects.order_by('-rating_avg', '-id').values_list('slugname', flat=True))
+        self.assertEqual(self.walk('ordering=-rating_avg'), expected)
+
+    def test_cursor_follows_search_rank(self):
+        response = self.client.get(reverse('product-list'), {'search': 'product', 'page_size': 10})
+        expected = [product['slugname'] for product in response.json()['results']]
+        self.assertEqual(self.walk('search=product'), expected)
+
+    def test_cursor_from_another_ordering_is_invalid(self):
+        response = self.client.get(reverse('product-list'), {'pagination': 'cursor', 'page_size': 2})
+        cursor = response.json()['next'].split('cursor=')[1]
+        response = self.client.get(reverse('product-list'), {'cursor': cursor, 'sort': 'stock'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BackInStockNotificationTests(APITestCase):
+    def setUp(self):
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        self.product = create_translated(Product, {'en': 'iPhone'}, slugname='iphone', price=100, stock=0, category=self.category)
+        for i in range(3):
+            user = User.objects.create_user(username=f'user{i}', password='password', email=f'user{i}@example.com')
+            WishlistItem.objects.create(wishlist=Wishlist.objects.create(user=user), product=self.product)
+
+    def test_notify_users_is_idempotent_per_restock(self):
+        restocked_at = self.product.updated_at
+        self.assertEqual(notify_users(self.product, restocked_at, chunk_size=2), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(notify_users(self.product, restocked_at), 0)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(notify_users(self.product, restocked_at + timedelta(days=1)), 3)
+        self.assertEqual(len(mail.outbox), 6)
+
+    def test_restock_schedules_task_after_commit(self):
+        with mock.patch('product_app.signals.notify_back_in_stock.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.product.stock = 5
+                self.product.save()
+        delay.assert_called_once_with(self.product.id, self.product.updated_at.isoformat())
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class ProductDirtyFieldsTests(APITestCase):
+    def setUp(self):
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        create_translated(Product, {'en': 'iPhone'}, slugname='iphone', price=100, stock=3, category=self.category)
+
+    def test_tracks_changes_against_loaded_values(self):
+        product = Product.objects.get(slugname='iphone')
+        self.assertEqual(product.get_dirty_fields(), {})
+        product.stock = 7
+        self.assertEqual(product.get_dirty_fields(), {'stock': 3})
+        self.assertEqual(product.previous_value('stock'), 3)
+
+        product.save(update_fields=list(product.get_dirty_fields()))
+        self.assertEqual(product.get_dirty_fields(), {})
+        self.assertEqual(product.previous_value('stock'), 7)
+
+    def test_stock_save_does_not_refetch_product(self):
+        product = Product.objects.get(slugname='iphone')
+        product.stock = 0
+        with self.assertNumQueries(1):
+            product.save()
+        with mock.patch('product_app.signals.notify_back_in_stock.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.stock = 2
+                with self.assertNumQueries(1):
+                    product.save()
+        delay.assert_called_once()
+
+
+class CategoryTreeTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = create_translated(Category, {'en': 'Electronics', 'fa': 'الکترونیک'}, slugname='electronics')
+        create_translated(Subcategory, {'en': 'Phones'}, slugname='phones', category=self.category)
+        self.url = reverse('category-tree')
+
+    def test_tree_is_cached_and_revalidated(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['translations']['fa']['name'], 'الکترونیک')
+        self.assertEqual(response.data[0]['sub_categories'][0]['slugname'], 'phones')
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_tree_is_invalidated_on_change(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            create_translated(Subcategory, {'en': 'Laptops'}, slugname='laptops', category=self.category)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data[0]['sub_categories']), 2)
+
+
+@override_settings(REDIS_URL='redis://127.0.0.1:6379/15')
+class TopSellerLeaderboardTests(APITestCase):
+    def setUp(self):
+        get_redis().flushdb()
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        self.other_category = create_translated(Category, {'en': 'Books'}, slugname='books')
+        self.phone = create_translated(Product, {'en': 'Phone'}, slugname='phone', price=100, category=self.category)
+        self.laptop = create_translated(Product, {'en': 'Laptop'}, slugname='laptop', price=900, category=self.category)
+        self.novel = create_translated(Product, {'en': 'Novel'}, slugname='novel', price=10, category=self.other_category)
+        self.url = reverse('top-seller')
+
+    def top(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['slugname'] for product in response.data['results']]
+
+    def sell(self, product, quantity, when=None, sign=1):
+        record_sales([(product.id, product.category_id, product.subcategory_id, quantity)], when=when, sign=sign)
+
+    def test_ranks_by_recorded_sales(self):
+        self.sell(self.phone, 2)
+        self.sell(self.novel, 5)
+        self.sell(self.laptop, 3)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.top(), ['novel', 'laptop', 'phone'])
+        self.assertFalse(any('ORDER BY' in query['sql'] for query in context.captured_queries))
+        self.assertEqual(self.top(category=self.category.id), ['laptop', 'phone'])
+        self.assertEqual(self.top(limit=1), ['novel'])
+
+    def test_cancellation_and_windows(self):
+        self.sell(self.phone, 4)
+        self.sell(self.laptop, 1, when=timezone.now() - timedelta(days=3))
+        self.sell(self.phone, 4, sign=-1)
+        self.assertEqual(self.top(), ['laptop'])
+        self.assertEqual(self.top(window='24h'), [])
+        self.assertEqual(self.top(window='7d'), ['laptop'])
+
+    def test_rebuild_from_database(self):
+        Product.objects.filter(pk=self.novel.pk).update(sales_count=7)
+        rebuild_leaderboard()
+        self.assertEqual(self.top(), ['novel'])
+
+    def test_rebuild_windows_from_sales_buckets(self):
+        record_sales_buckets([(self.laptop.id, self.category.id, None, 2)], timezone.now())
+        record_sales_buckets([(self.novel.id, self.other_category.id, None, 6)], timezone.now() - timedelta(days=5))
+        compact_sales_buckets()
+        rebuild_leaderboard()
+        self.assertEqual(self.top(window='24h'), ['laptop'])
+        self.assertEqual(self.top(window='7d'), ['novel', 'laptop'])
+
+    def test_empty_redis_window_falls_back_to_sales_buckets(self):
+        record_sales_buckets([(self.phone.id, self.category.id, None, 3)], timezone.now())
+        self.assertEqual(self.top(window='24h', category=self.category.id), ['phone'])
+
+    def test_invalid_scope_is_rejected(self):
+        for name in ('category', 'subcategory'):
+            response = self.client.get(self.url, {name: 'abc'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SalesBucketTests(APITestCase):
+    def setUp(self):
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        self.other_category = create_translated(Category, {'en': 'Books'}, slugname='books')
+        self.phone = create_translated(Product, {'en': 'Phone'}, slugname='phone', price=100, category=self.category)
+        self.novel = create_translated(Product, {'en': 'Novel'}, slugname='novel', price=10, category=self.other_category)
+
+    def sell(self, product, quantity, when, sign=1):
+        record_sales_buckets([(product.id, product.category_id, product.subcategory_id, quantity)], when, sign)
+
+    def test_sales_in_the_same_hour_share_a_bucket(self):
+        now = timezone.now()
+        self.sell(self.phone, 2, now)
+        self.sell(self.phone, 3, now)
+        self.sell(self.phone, 1, now, sign=-1)
+        bucket = SalesBucket.objects.get()
+        self.assertEqual((bucket.granularity, bucket.quantity), (SalesBucket.HOURLY, 4))
+        self.assertEqual(bucket.bucket_start, now.replace(minute=0, second=0, microsecond=0))
+
+    def test_compaction_folds_old_hours_into_days(self):
+        now = timezone.now()
+        old = (now - timedelta(days=5)).replace(hour=10)
+        self.sell(self.phone, 2, old)
+        self.sell(self.phone, 3, old + timedelta(hours=5))
+        self.sell(self.phone, 1, now)
+        compact_sales_buckets()
+        self.sell(self.phone, 1, old)
+        compact_sales_buckets()
+        daily = SalesBucket.objects.get(granularity=SalesBucket.DAILY)
+        self.assertEqual(daily.quantity, 6)
+        self.assertEqual(daily.bucket_start, old.replace(hour=0, minute=0, second=0, microsecond=0))
+        self.assertEqual(SalesBucket.objects.get(granularity=SalesBucket.HOURLY).quantity, 1)
+
+    def test_windowed_ranking(self):
+        now = timezone.now()
+        self.sell(self.phone, 2, now)
+        self.sell(self.novel, 5, now - timedelta(days=3))
+        self.sell(self.phone, 9, now - timedelta(days=20))
+        compact_sales_buckets()
+        with self.assertNumQueries(1):
+            self.assertEqual(bucket_top_sellers(window='24h'), [(self.phone.id, 2)])
+        self.assertEqual(bucket_top_sellers(window='7d'), [(self.novel.id, 5), (self.phone.id, 2)])
+        self.assertEqual(bucket_top_sellers(window='30d'), [(self.phone.id, 11), (self.novel.id, 5)])
+        self.assertEqual(bucket_top_sellers(window='7d', category=self.category.id), [(self.phone.id, 2)])
+
+    def test_top_sellers_fall_back_to_buckets(self):
+        self.sell(self.novel, 5, timezone.now())
+        with mock.patch('product_app.views.top_sellers', side_effect=RedisError('down')):
+            response = self.client.get(reverse('top-seller'), {'window': '24h'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product['slugname'] for product in response.data['results']], ['novel'])
+
+
+class ProductBulkImportTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='adminpassword', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        self.subcategory = create_translated(Subcategory, {'en': 'Phones'}, slugname='phones', category=self.category)
+        self.existing = create_translated(Product, {'en': 'Galaxy Phone'}, slugname='galaxy-phone', price=100, category=self.category)
+
+    def upload(self, content, name='products.csv'):
+        return self.client.post(reverse('product-bulk-import'), {'file': SimpleUploadedFile(name, content.encode())}, format='multipart')
+
+    def test_csv_import_creates_products_and_reports_bad_rows(self):
+        content = (
+            'name_en,name_fa,description_en,price,discount_percentage,stock,category,subcategory\n'
+            'Pixel Phone,گوشی پیکسل,A phone,200,10,5,electronics,phones\n'
+            'Galaxy Phone,,,100,,1,electronics,\n'
+            'Cheap Cable,,,-1,,1,electronics,\n'
+            'Fast Charger,,,30,,2,books,\n'
+            'Phone Case,,,15,,,electronics,\n'
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.upload(content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4, 5])
+        self.assertIn('name_en', response.data['errors'][0]['errors'])
+        self.assertIn('price', response.data['errors'][1]['errors'])
+        self.assertIn('category', response.data['errors'][2]['errors'])
+        self.assertEqual(len([query for query in context.captured_queries if query['sql'].startswith('INSERT')]), 2)
+
+        pixel = Product.objects.get(slugname='pixel-phone')
+        self.assertEqual((pixel.price_after_discount, pixel.price_after_discount_in_rials), (180, 180 * 600000))
+        self.assertEqual((pixel.subcategory, pixel.stock), (self.subcategory, 5))
+        self.assertEqual(pixel.safe_translation_getter('name', language_code='fa'), 'گوشی پیکسل')
+        self.assertEqual(Product.objects.get(slugname='phone-case').brand, 'No Brand')
+        self.assertTrue(Product.objects.filter(search_vector='pixel').exists())
+
+    def test_jsonl_import_command(self):
+        rows = [
+            {'name_en': 'Galaxy Phone Pro', 'slugname': 'galaxy-phone', 'price': 300, 'category': 'electronics'},
+            {'name_en': 'Galaxy Phone', 'name_fa': 'گلکسی', 'price': 100, 'category': 'electronics'},
+            {'name_en': 'Galaxy Tab', 'price': 400, 'category': 'electronics'},
+        ]
+        path = self.write_file('\n'.join(json.dumps(row) for row in rows) + '\nnot json\n', '.jsonl')
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_products', path, stdout=stdout, stderr=stderr)
+        self.assertIn('Imported 1 products, 3 rows rejected', stdout.getvalue())
+        self.assertIn('Row 4:', stderr.getvalue())
+        self.assertTrue(Product.objects.filter(slugname='galaxy-tab').exists())
+
+    def write_file(self, content, suffix):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    def test_export_streams_rows(self):
+        response = self.client.get(reverse('product-export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['slugname'], rows[0]['name_en'], rows[0]['category']), ('galaxy-phone', 'Galaxy Phone', 'electronics'))
+
+        response = self.client.get(reverse('product-export'), {'file_format': 'jsonl'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['price'], 100)
+
+
+def image_upload(name, size=(1000, 600), color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ProductImageVariantTests(APITestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.admin = User.objects.create_user(username='admin', password='adminpassword', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        self.product = create_translated(Product, {'en': 'Phone'}, slugname='phone', price=100, category=self.category)
+
+    def upload(self, field, image):
+        setattr(self.product, field, image)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.product.refresh_from_db()
+
+    def test_upload_generates_hashed_variants_and_thumbnail(self):
+        self.upload('image1', image_upload('phone.png'))
+        variants = self.product.image_variants['image1']
+        self.assertEqual(variants['source'], self.product.image1.name)
+        self.assertEqual(list(variants['widths']), ['200', '400', '800'])
+        self.assertIn('webp', variants['widths']['200'])
+        self.assertRegex(variants['widths']['200']['webp'], r'^products/variants/[0-9a-f]{32}\.webp$')
+        with Image.open(self.product.thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (300, 300))
+
+        response = self.client.get(reverse('product-detail', args=[self.product.id]))
+        urls = response.data['image_variants']['image1']['400']
+        self.assertTrue(urls['webp'].startswith('http://testserver/media/products/variants/'))
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.data['results'][0]['image_variants']['400'], urls)
+
+    def test_available_encodings_can_be_written(self):
+        encodings = available_encodings()
+        self.assertIn('webp', encodings)
+        image = Image.new('RGB', (8, 8))
+        for name, (image_format, options) in ENCODINGS.items():
+            if name in encodings:
+                self.assertTrue(encode(image, image_format, **options))
+            else:
+                with self.assertRaises((KeyError, OSError)):
+                    encode(image, image_format, **options)
+
+    def test_identical_images_share_variants(self):
+        self.upload('image1', image_upload('a.png'))
+        self.upload('image2', image_upload('b.png'))
+        variants = self.product.image_variants
+        self.assertEqual(variants['image1']['widths'], variants['image2']['widths'])
+
+    def test_small_images_are_not_upscaled(self):
+        self.upload('image1', image_upload('small.png', size=(150, 100)))
+        self.assertEqual(list(self.product.image_variants['image1']['widths']), ['150'])
+
+    def test_only_image_changes_queue_the_task(self):
+        with mock.patch('product_app.signals.generate_image_variants.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.product.stock = 3
+                self.product.save()
+            delay.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.product.image3 = image_upload('c.png')
+                self.product.save()
+            delay.assert_called_once_with(self.product.id)
+
+    def test_generated_variants_retire_cached_responses(self):
+        cache.clear()
+        with mock.patch('product_app.signals.generate_image_variants.delay'):
+            self.upload('image1', image_upload('phone.png'))
+        self.client.force_authenticate(None)
+        url = reverse('product-detail', args=[self.product.id])
+        self.assertEqual(self.client.get(url).json()['image_variants'], {})
+        generate_image_variants(self.product.id)
+        self.assertIn('image1', self.client.get(url).json()['image_variants'])
+
+
+class ContentAddressedImageTests(APITestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        self.phone = create_translated(Product, {'en': 'Phone'}, slugname='phone', price=100, category=self.category)
+        self.tablet = create_translated(Product, {'en': 'Tablet'}, slugname='tablet', price=200, category=self.category)
+
+    def stored_files(self, directory='products/images'):
+        return sorted(os.listdir(os.path.join(self.media_root, directory)))
+
+    def test_identical_uploads_are_stored_once(self):
+        with mock.patch('product_app.signals.generate_image_variants.delay'):
+            self.phone.image1 = image_upload('Screenshot.png')
+            self.phone.save()
+            self.tablet.image1 = image_upload('Screenshot.png')
+            self.tablet.image2 = image_upload('other.png', color='blue')
+            self.tablet.save()
+        self.assertEqual(self.phone.image1.name, self.tablet.image1.name)
+        self.assertRegex(self.phone.image1.name, r'^products/images/[0-9a-f]{32}\.png$')
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_reuploading_the_same_image_is_a_no_op(self):
+        with mock.patch('product_app.signals.generate_image_variants.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.phone.image1 = image_upload('phone.png')
+                self.phone.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.phone.image1 = image_upload('phone-again.png')
+                self.phone.save()
+        delay.assert_called_once_with(self.phone.id)
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_gc_deletes_old_unreferenced_files(self):
+        with mock.patch('product_app.signals.generate_image_variants.delay'):
+            self.phone.image1 = image_upload('phone.png')
+            self.phone.save()
+            self.phone.image1 = image_upload('replacement.png', color='green')
+            self.phone.save()
+        orphan = next(name for name in self.stored_files() if name != os.path.basename(self.phone.image1.name))
+        old = (timezone.now() - timedelta(days=2)).timestamp()
+        for name in self.stored_files():
+            os.utime(os.path.join(self.media_root, 'products/images', name), (old, old))
+
+        stdout = io.StringIO()
+        call_command('gc_product_images', '--dry-run', stdout=stdout)
+        self.assertIn('Would delete 1 unreferenced files.', stdout.getvalue())
+        self.assertEqual(len(self.stored_files()), 2)
+
+        call_command('gc_product_images', stdout=io.StringIO())
+        self.assertEqual(self.stored_files(), [os.path.basename(self.phone.image1.name)])
+        self.assertNotIn(orphan, self.stored_files())
+
+    def age_files(self):
+        old = (timezone.now() - timedelta(days=2)).timestamp()
+        for name in self.stored_files():
+            os.utime(os.path.join(self.media_root, 'products/images', name), (old, old))
+
+    def test_reusing_an_orphaned_blob_protects_it_from_gc(self):
+        with mock.patch('product_app.signals.generate_image_variants.delay'):
+            self.phone.image1 = image_upload('phone.png')
+            self.phone.save()
+            Product.objects.filter(pk=self.phone.pk).update(image1='')
+            self.age_files()
+            self.tablet.image1 = image_upload('tablet.png')
+            self.tablet.save()
+        path = os.path.join(self.media_root, self.tablet.image1.name)
+        self.assertGreater(os.path.getmtime(path), (timezone.now() - timedelta(hours=1)).timestamp())
+        Product.objects.filter(pk=self.tablet.pk).update(image1='')
+        call_command('gc_product_images', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(path))
+
+    def test_gc_rechecks_references_before_deleting(self):
+        with mock.patch('product_app.signals.generate_image_variants.delay'):
+            self.phone.image1 = image_upload('phone.png')
+            self.phone.save()
+        self.age_files()
+        with mock.patch('product_app.management.commands.gc_product_images.Command.referenced_names', return_value=set()):
+            call_command('gc_product_images', stdout=io.StringIO())
+        self.assertEqual(self.stored_files(), [os.path.basename(self.phone.image1.name)])
+
+
+class TranslationCacheTests(APITestCase):
+    def setUp(self):
+        self.translations = cache
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        self.product = create_translated(Product, {'en': 'Phone', 'fa': 'تلفن'}, slugname='phone', price=100, category=self.category)
+        self.translations.clear()
+
+    def name(self, language='en'):
+        product = Product.objects.get(pk=self.product.pk)
+        return product.safe_translation_getter('name', language_code=language)
+
+    def test_translations_are_read_from_the_database_once(self):
+        product = Product.objects.get(pk=self.product.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(product.safe_translation_getter('name', language_code='fa'), 'تلفن')
+        product = Product.objects.get(pk=self.product.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(product.safe_translation_getter('name', language_code='fa'), 'تلفن')
+
+        self.translations.clear_local()
+        product = Product.objects.get(pk=self.product.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(product.safe_translation_getter('name', language_code='fa'), 'تلفن')
+
+    def test_save_translations_refreshes_both_tiers(self):
+        self.assertEqual(self.name(), 'Phone')
+        self.product.set_current_language('en')
+        self.product.name = 'Smart Phone'
+        self.product.save_translations()
+        self.assertEqual(self.name(), 'Smart Phone')
+        self.translations.clear_local()
+        self.assertEqual(self.name(), 'Smart Phone')
+
+    def test_local_tier_returns_copies(self):
+        self.translations.set('translations.key', {'name': 'Phone'})
+        self.translations.get('translations.key')['name'] = 'changed'
+        self.assertEqual(self.translations.get('translations.key'), {'name': 'Phone'})
+        self.translations.delete('translations.key')
+        self.assertIsNone(self.translations.get('translations.key'))
+
+    def test_only_translation_keys_use_the_local_tier(self):
+        self.translations.set_many({'translations.key': 1, 'response:key': 2})
+        caches['shared'].delete_many(['translations.key', 'response:key'])
+        self.assertEqual(self.translations.get_many(['translations.key', 'response:key']), {'translations.key': 1})
+
+
+class AnonymousResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        self.phone = create_translated(Product, {'en': 'Phone'}, slugname='phone', price=100, stock=3, category=self.category)
+        self.laptop = create_translated(Product, {'en': 'Laptop'}, slugname='laptop', price=900, stock=1, category=self.category)
+
+    def change(self, obj, **fields):
+        for name, value in fields.items():
+            setattr(obj, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            obj.save()
+
+    def test_anonymous_reads_are_served_from_cache(self):
+        url = reverse('product-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(self.client.get(url, {'page_size': 1}).content, response.content)
+
+    def test_product_changes_invalidate_only_their_tags(self):
+        phone_url = reverse('product-detail', args=[self.phone.id])
+        list_url = reverse('product-list')
+        self.client.get(phone_url)
+        self.client.get(list_url)
+
+        self.change(self.laptop, stock=0)
+        with self.assertNumQueries(0):
+            self.client.get(phone_url)
+        response = self.client.get(list_url)
+        self.assertEqual({product['slugname']: product['in_stock'] for product in response.data['results']},
+                         {'phone': True, 'laptop': False})
+
+        self.change(self.phone, stock=0)
+        response = self.client.get(phone_url)
+        self.assertEqual(response.data['stock'], 0)
+
+    def test_stock_changes_only_retire_pages_showing_the_product(self):
+        books = create_translated(Category, {'en': 'Books'}, slugname='books')
+        create_translated(Product, {'en': 'Novel'}, slugname='novel', price=20, stock=5, category=books)
+        list_url = reverse('product-list')
+        pages = [{'category': books.id}, {'page_size': 2}, {'category': self.category.id}, {}]
+        for params in pages:
+            self.client.get(list_url, params)
+
+        self.change(self.laptop, stock=0)
+        for params in pages[:2]:
+            with self.assertNumQueries(0):
+                self.client.get(list_url, params)
+        for params in pages[2:]:
+            response = self.client.get(list_url, params)
+            self.assertFalse({product['slugname']: product['in_stock'] for product in response.json()['results']}['laptop'])
+
+    def test_new_and_moved_products_retire_list_pages(self):
+        books = create_translated(Category, {'en': 'Books'}, slugname='books')
+        list_url = reverse('product-list')
+        self.client.get(list_url)
+        self.client.get(list_url, {'category': books.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_translated(Product, {'en': 'Tablet'}, slugname='tablet', price=300, stock=2, category=self.category)
+        response = self.client.get(list_url)
+        self.assertIn('tablet', [product['slugname'] for product in response.json()['results']])
+
+        self.change(self.phone, category=books)
+        response = self.client.get(list_url, {'category': books.id})
+        self.assertEqual([product['slugname'] for product in response.json()['results']], ['phone'])
+
+    def test_category_changes_invalidate_category_reads(self):
+        url = reverse('category-list')
+        self.client.get(url)
+        self.category.set_current_language('en')
+        self.change(self.category, name='Gadgets')
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['translations']['en']['name'], 'Gadgets')
+
+    def test_authenticated_requests_bypass_the_cache(self):
+        admin = User.objects.create_user(username='admin', password='adminpassword', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.client.get(reverse('product-list'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('product-list'), HTTP_AUTHORIZATION='Bearer token')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(len(context.captured_queries), 0)
+        self.assertNotIn('ETag', response)
+
+
+class ProductFilterTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = create_translated(Category, {'en': 'Electronics'}, slugname='electronics')
+        self.other_category = create_translated(Category, {'en': 'Books'}, slugname='books')
+        self.subcategory = create_translated(Subcategory, {'en': 'Phones'}, slugname='phones', category=self.category)
+        products = [
+            ('phone', 'Acme', 80, 5, self.category, self.subcategory, 3),
+            ('tablet', 'Acme', 300, 0, self.category, None, 9),
+            ('laptop', 'Globex', 1200, 2, self.category, None, 1),
+            ('novel', 'No Brand', 20, 7, self.other_category, None, 0),
+        ]
+        for slug, brand, price, stock, category, subcategory, sales in products:
+            create_translated(Product, {'en': slug.title()}, slugname=slug, brand=brand, price=price, stock=stock,
+                              category=category, subcategory=subcategory, sales_count=sales)
+
+    def slugs(self, **params):
+        response = self.client.get(reverse('product-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['slugname'] for product in response.json()['results']]
+
+    def test_price_range(self):
+        self.assertEqual(self.slugs(minPrice=50, maxPrice=500), ['phone', 'tablet'])
+        self.assertEqual(self.slugs(minPrice=300), ['tablet', 'laptop'])
+        self.assertEqual(self.slugs(maxPrice=80), ['novel', 'phone'])
+
+    def test_brand_stock_and_category_filters(self):
+        self.assertEqual(self.slugs(brand='Acme,Globex'), ['phone', 'tablet', 'laptop'])
+        self.assertEqual(self.slugs(in_stock='true', category=self.category.id), ['phone', 'laptop'])
+        self.assertEqual(self.slugs(in_stock='false'), ['tablet'])
+        self.assertEqual(self.slugs(subcategory=self.subcategory.id), ['phone'])
+        response = self.client.get(reverse('product-list'), {'category': 999999})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sort(self):
+        self.assertEqual(self.slugs(sort='sales_count', sort_order='desc'), ['tablet', 'phone', 'laptop', 'novel'])
+        self.assertEqual(self.slugs(sort_order='desc'), ['laptop', 'tablet', 'phone', 'novel'])
+        response = self.client.get(reverse('product-list'), {'sort': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_facets_come_from_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('product-facets'))
+        facets = response.json()
+        self.assertEqual(facets['count'], 4)
+        self.assertEqual(facets['brands'], [{'brand': 'Acme', 'count': 2}, {'brand': 'Globex', 'count': 1}, {'brand': 'No Brand', 'count': 1}])
+        self.assertEqual({bucket['bucket']: bucket['count'] for bucket in facets['price_buckets']},
+                         {'0-50': 1, '50-100': 1, '100-250': 0, '250-500': 1, '500-1000': 0, '1000+': 1})
+        self.assertEqual(facets['in_stock'], {'true': 3, 'false': 1})
+
+        facets = self.client.get(reverse('product-facets'), {'maxPrice': 100, 'in_stock': 'true'}).json()
+        self.assertEqual(facets['count'], 2)
+        self.assertEqual(facets['brands'], [{'brand': 'Acme', 'count': 1}, {'brand': 'No Brand', 'count': 1}])
+
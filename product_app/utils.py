@@ -1,29 +1,79 @@
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Cast
+from django.template.loader import get_template
 from django.utils.html import strip_tags
 from order_app.models import WishlistItem
+from .models import Product
 import logging
 
 logger = logging.getLogger(__name__)
 
-def notify_users(product):
+RIAL_RATE = 600000
+
+def notify_users(product, restocked_at, chunk_size=500):
     logger.info(f"Notifying users about product availability: {product.name}")
-    wishlist_items = WishlistItem.objects.filter(product=product)
-    notified_users = set()  
-
-    for item in wishlist_items:
-        user = item.wishlist.user
-        if user.id not in notified_users:
-            logger.info(f"Sending email to user {user.id}")
- 
-            subject = f"Product {product.name} is now available!"
-            html_message = render_to_string('email/product_available.html', {'product': product, 'user': user})
-            plain_message = strip_tags(html_message)
-            from_email = 'webmaster@example.com'  
-            to = user.email
-
-            logger.info("Calling send_mail function")
-            send_mail(subject, plain_message, from_email, [to], html_message=html_message)
-            logger.info("send_mail function called successfully")
-
-            notified_users.add(user.id)  
\ No newline at end of file
+    template = get_template('email/product_available.html')
+    subject = f"Product {product.name} is now available!"
+    from_email = 'webmaster@example.com'
+    pending_items = WishlistItem.objects.filter(product=product).filter(
+        Q(notified_at__isnull=True) | Q(notified_at__lt=restocked_at)
+    ).select_related('wishlist__user').order_by('id')
+
+    sent = 0
+    last_id = 0
+    with get_connection() as connection:
+        while True:
+            items = list(pending_items.filter(id__gt=last_id)[:chunk_size])
+            if not items:
+                break
+            last_id = items[-1].id
+
+            messages = []
+            for item in items:
+                user = item.wishlist.user
+                if not user.email:
+                    continue
+                html_message = template.render({'product': product, 'user': user})
+                message = EmailMultiAlternatives(subject, strip_tags(html_message), from_email, [user.email], connection=connection)
+                message.attach_alternative(html_message, 'text/html')
+                messages.append(message)
+
+            if messages:
+                sent += connection.send_messages(messages) or 0
+            WishlistItem.objects.filter(id__in=[item.id for item in items]).update(notified_at=restocked_at)
+            logger.info(f"Sent {len(messages)} availability emails for product {product.id}")
+
+    return sent
+
+
+def update_rating_aggregates(product_id, added=None, removed=None):
+    if added == removed:
+        return
+    changes = {}
+    if added is not None:
+        changes[f'rating_{added}_count'] = F(f'rating_{added}_count') + 1
+    if removed is not None:
+        changes[f'rating_{removed}_count'] = F(f'rating_{removed}_count') - 1
+    count_delta = (added is not None) - (removed is not None)
+    if count_delta:
+        changes['rating_count'] = F('rating_count') + count_delta
+    Product.objects.filter(pk=product_id).update(**changes)
+
+    rating_total = sum(star * F(f'rating_{star}_count') for star in range(1, 6))
+    Product.objects.filter(pk=product_id).update(rating_avg=Case(
+        When(rating_count=0, then=Value(0.0)),
+        default=Cast(rating_total, FloatField()) / F('rating_count'),
+        output_field=FloatField(),
+    ))
+
+
+def update_search_vectors(queryset):
+    translations = Product._parler_meta.root_model.objects.filter(master_id=OuterRef('pk')).values('master_id')
+    vectors = translations.annotate(
+        vector=SearchVector(StringAgg('name', ' ', default=Value('')), weight='A', config='simple')
+        + SearchVector(StringAgg('description', ' ', default=Value('')), weight='B', config='simple')
+    ).values('vector')
+    return queryset.update(search_vector=Subquery(vectors))
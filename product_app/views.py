@@ -1,5 +1,9 @@
+import io
+import re
 from rest_framework import viewsets
-from django.db.models import Q
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
 from .models import *
 from .serializers import *
 from .permissions import *
@@ -16,17 +20,29 @@ from rest_framework.exceptions import ValidationError, NotFound
 from parler.utils.context import activate, switch_language
 from rest_framework.pagination import PageNumberPagination
 from django.db import transaction
+from Azonix.pagination import KeysetPaginationMixin
+from Azonix.streaming import CONTENT_TYPES, streaming_response
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.decorators import action
+from redis.exceptions import RedisError
+from .bulk import EXPORT_FIELDS, export_rows, file_format_for, import_products
+from .caching import AnonymousResponseCacheMixin, get_category_tree, product_list_cache_tags
+from .filters import ProductFilter, product_facets
+from .leaderboard import WINDOWS, bucket_top_sellers, top_sellers
+from order_app.wishlists import wishlisted_product_ids
 import logging
 logger = logging.getLogger(__name__)
 # Category
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    response_cache_tags = ('categories',)
     authentication_classes = [JWTAuthentication]
     parser_classes = [JSONParser]
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'tree']:
             self.permission_classes = [AllowAny]
         else:
             self.permission_classes = [IsAuthenticatedOrReadOnly, IsAdminUser]
@@ -37,6 +53,18 @@ class CategoryViewSet(viewsets.ModelViewSet):
         activate(language)
         return super().create(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        entry = get_category_tree()
+        etag = f'"{entry["etag"]}"'
+        response = get_conditional_response(request, etag=etag, last_modified=entry['last_modified'])
+        if response is None:
+            response = Response(entry['tree'])
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        patch_cache_control(response, public=True, max_age=60)
+        return response
+
     def get_queryset(self):
         queryset = super().get_queryset()
         params = self.request.query_params
@@ -81,9 +109,10 @@ class CategoryViewSet(viewsets.ModelViewSet):
             return Response({'error': f'An error occurred while deleting the category: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 # SubCategory
-class SubcategoryViewSet(viewsets.ModelViewSet):
+class SubcategoryViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Subcategory.objects.all()
     serializer_class = SubcategorySerializer
+    response_cache_tags = ('categories',)
     authentication_classes = [JWTAuthentication]
     parser_classes = [JSONParser]
     lookup_url_kwarg = 'subcategory_id'
@@ -135,8 +164,18 @@ class SubcategoryViewSet(viewsets.ModelViewSet):
             return Response({'error': f'An error occurred while deleting the Subcategory: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # Products
-class ProductPagination(PageNumberPagination):
+SORT_FIELDS = {
+    'price': 'price_after_discount',
+    'created_at': 'created_at',
+    'sales_count': 'sales_count',
+    'rating': 'rating_avg',
+    'stock': 'stock',
+    'category': 'category_id',
+}
+
+class ProductPagination(KeysetPaginationMixin, PageNumberPagination):
     page_size_query_param = 'page_size'
+    keyset_ordering = ('price_after_discount', 'id')
 
     def get_paginated_response(self, data):
         return Response({
@@ -148,16 +187,34 @@ class ProductPagination(PageNumberPagination):
         })
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsAdminUser]
     authentication_classes = [JWTAuthentication]
     parser_classes = [MultiPartParser, JSONParser]
     pagination_class = ProductPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    search_fields = ['translations__name']
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = ProductFilter
     lookup_url_kwarg = 'product_id'
+    response_cache_actions = ('list', 'retrieve', 'facets')
+    response_item_tag = 'product'
+
+    def get_permissions(self):
+        if self.action in ['list', 'retrieve', 'facets']:
+            self.permission_classes = [AllowAny]
+        return super().get_permissions()
+
+    def get_response_cache_tags(self, request, *args, **kwargs):
+        if self.lookup_url_kwarg in kwargs:
+            return [f'product:{kwargs[self.lookup_url_kwarg]}', 'categories']
+        return product_list_cache_tags(request.GET)
+
+    def get_response_cache_timeout(self, request):
+        # Catalog-wide facets change with any product's stock, which bumps no tag they depend on.
+        if self.action == 'facets' and len(product_list_cache_tags(request.GET)) == 1:
+            return self.response_cache_max_age
+        return super().get_response_cache_timeout(request)
 
     @transaction.atomic
     def create(self, request, *args, **kwargs):
@@ -172,51 +229,47 @@ class ProductViewSet(viewsets.ModelViewSet):
             transaction.set_rollback(True)
             return Response({'error': f'An error occurred while creating the product: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ProductListSerializer
+        return ProductSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        # ?with_wishlist=1 adds in_wishlist with one membership lookup for the whole page.
+        kwargs.setdefault('context', self.get_serializer_context())
+        request = self.request
+        if args and request.method == 'GET' and request.user.is_authenticated \
+                and request.query_params.get('with_wishlist') in ('1', 'true'):
+            products = args[0] if kwargs.get('many') else [args[0]]
+            kwargs['context']['wishlisted'] = wishlisted_product_ids(request.user.id, [product.id for product in products])
+        return super().get_serializer(*args, **kwargs)
+
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().prefetch_related('translations')
+        if self.action != 'list':
+            queryset = queryset.select_related('category', 'subcategory').prefetch_related(
+                'category__translations', 'subcategory__translations'
+            )
         params = self.request.query_params
 
-        category_id = params.get('category')
-        subcategory_id = params.get('subcategory')
-        
-        if category_id or subcategory_id:
-            try:
-                if category_id:
-                    Category.objects.get(id=category_id)
-                if subcategory_id:
-                    Subcategory.objects.get(id=subcategory_id)
-            except (Category.DoesNotExist, Subcategory.DoesNotExist):
-                raise ValidationError("Invalid category or subcategory ID(s) provided.")
-
-        if category_id and subcategory_id:
-            queryset = queryset.filter(category_id=category_id, subcategory_id=subcategory_id)
-        elif category_id:
-            queryset = queryset.filter(category_id=category_id)
-        elif subcategory_id:
-            queryset = queryset.filter(subcategory_id=subcategory_id)
-
-        min_price = params.get('minPrice')
-        max_price = params.get('maxPrice')
-        if min_price and max_price:
-            queryset = queryset.filter(price_after_discount__gte=float(min_price), price_after_discount__lte=float(max(max_price)))
-        elif min_price:
-            queryset = queryset.filter(price_after_discount__gte(float(min_price)))
-        elif max_price:
-            queryset = queryset.filter(price_after_discount__lte(float(max_price)))
-
-        sort_field = params.get('sort', 'category')
-        if sort_field:
-            queryset = queryset.order_by(sort_field)
-
+        sort_field = params.get('sort', 'price')
+        if sort_field not in SORT_FIELDS:
+            raise ValidationError(f"Invalid sort. Choose one of: {', '.join(SORT_FIELDS)}.")
         sort_order = params.get('sort_order', 'asc')
-        if sort_order == 'desc':
-            queryset = queryset.order_by('-price_after_discount')
-        else:
-            queryset = queryset.order_by('price_after_discount')
-
-        search_query = params.get('search')
-        if search_query:
-            queryset = queryset.filter(Q(translations__name__icontains=search_query))
+        if sort_order not in ('asc', 'desc'):
+            raise ValidationError("sort_order must be 'asc' or 'desc'.")
+        prefix = '-' if sort_order == 'desc' else ''
+        queryset = queryset.order_by(f'{prefix}{SORT_FIELDS[sort_field]}', f'{prefix}id')
+
+        search_terms = re.findall(r'\w+', params.get('search', ''))
+        if search_terms:
+            query = SearchQuery(' & '.join(f'{term}:*' for term in search_terms), config='simple', search_type='raw')
+            # ts_rank is a real; as a double precision it survives the cursor round trip exactly.
+            queryset = queryset.filter(search_vector=query).annotate(
+                search_rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+            )
+            if 'sort' not in params and 'sort_order' not in params:
+                queryset = queryset.order_by('-search_rank', 'id')
 
         return queryset
 
@@ -226,6 +279,34 @@ class ProductViewSet(viewsets.ModelViewSet):
         except Http404:
             raise NotFound('Product not found.')
 
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        return Response(product_facets(self.filter_queryset(self.get_queryset())))
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'A CSV or JSONL file is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.query_params.get('file_format') or file_format_for(upload.name)
+        if file_format not in CONTENT_TYPES:
+            return Response({'error': f"Invalid file_format. Choose one of: {', '.join(CONTENT_TYPES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            report = import_products(io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''), file_format)
+        except UnicodeDecodeError as e:
+            return Response({'error': f'The file must be UTF-8 encoded: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': f'An error occurred while importing products: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(report, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in CONTENT_TYPES:
+            return Response({'error': f"Invalid file_format. Choose one of: {', '.join(CONTENT_TYPES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.filter_queryset(self.get_queryset())
+        return streaming_response(file_format, EXPORT_FIELDS, export_rows(queryset), 'products')
+
     def retrieve(self, request, *args, **kwargs):
         try:
             print("retrieve method called")
@@ -379,12 +460,50 @@ class RatingViewSet(viewsets.ModelViewSet):
             return Response({'error': f'An error occurred while deleting the rating: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)       
 
 #TopSeller
-class TopSellerAPIView(ListAPIView):
+class TopSellerAPIView(AnonymousResponseCacheMixin, ListAPIView):
     queryset = Product.objects.all()
-    serializer_class = ProductSerializer
+    serializer_class = ProductListSerializer
     permission_classes = [AllowAny]
     authentication_classes = []
+    response_cache_timeout = 60
+    response_item_tag = 'product'
 
+    def get_response_cache_tags(self, request, *args, **kwargs):
+        return product_list_cache_tags(request.GET)
 
     def get_queryset(self):
-        return self.queryset.order_by('-sales_count')[:10]
+        params = self.request.query_params
+        window = params.get('window')
+        if window and window not in WINDOWS:
+            raise ValidationError(f"Invalid window. Choose one of: {', '.join(WINDOWS)}.")
+        try:
+            limit = min(max(int(params.get('limit', 10)), 1), 100)
+        except ValueError:
+            raise ValidationError("limit must be an integer.")
+        scope = {}
+        for name in ('category', 'subcategory'):
+            if params.get(name):
+                try:
+                    scope[name] = int(params[name])
+                except ValueError:
+                    raise ValidationError(f"{name} must be an integer.")
+
+        queryset = self.queryset.prefetch_related('translations')
+        try:
+            ranking = top_sellers(limit, window=window, **scope)
+        except RedisError as e:
+            logger.error(f"Error reading the top seller leaderboard: {str(e)}")
+            ranking = None
+
+        # An empty window in Redis may just mean the leaderboard hasn't been rebuilt yet.
+        if not ranking and window:
+            ranking = bucket_top_sellers(limit, window=window, **scope)
+        if ranking is None:
+            if 'subcategory' in scope:
+                queryset = queryset.filter(subcategory_id=scope['subcategory'])
+            elif 'category' in scope:
+                queryset = queryset.filter(category_id=scope['category'])
+            return queryset.order_by('-sales_count')[:limit]
+
+        products = queryset.in_bulk([product_id for product_id, _ in ranking])
+        return [products[product_id] for product_id, _ in ranking if product_id in products]
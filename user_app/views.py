@@ -15,6 +15,7 @@ from django.utils.translation import gettext_lazy as _
 import logging
 from .permissions import IsOwnerOrAdmin
 from rest_framework.generics import CreateAPIView, GenericAPIView  
+from Azonix.pagination import KeysetPaginationMixin
 
 logger = logging.getLogger(__name__)
 # Auth
@@ -85,7 +86,7 @@ class LogoutView(APIView):
             return Response(data={'message': 'An error occurred during logout.', 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # Pagination
-class UserPagination(PageNumberPagination):
+class UserPagination(KeysetPaginationMixin, PageNumberPagination):
     page_size_query_param = 'page_size'
 
     def get_paginated_response(self, data):